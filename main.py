@@ -1,11 +1,34 @@
 from mcp.server.fastmcp import FastMCP, Image
 import asyncio
-import base64
+import functools
+import io
+import os
+import re
+import shlex
+import struct
 import sys
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from collections.abc import Sequence
 from loguru import logger
+
+# Prefer pybase64's SIMD encoder for screenshots when it is installed
+try:
+    from pybase64 import b64encode
+except ImportError:
+    from base64 import b64encode
+
+# Pillow is optional; it is only needed for the raw screencap path below
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    PILImage = None
+
 from vision import (
     describe_screen_interactions,
     find_element_coordinates_by_description,
+    find_multiple_element_coordinates,
     run_prompt_against_screen,
 )
 
@@ -13,7 +36,19 @@ from vision import (
 # Configure logging to use stderr for MCP server compatibility
 # The default stderr sink is already added by loguru
 # We can add additional configuration if needed
-logger.configure(handlers=[{"sink": sys.stderr, "level": "INFO"}])
+# Records are written by a background thread (enqueue=True), so a tap does not
+# wait on stderr; per-command messages are DEBUG and formatted lazily.
+logger.configure(
+    handlers=[
+        {
+            "sink": sys.stderr,
+            "level": "INFO",
+            "enqueue": True,
+            "backtrace": False,
+            "diagnose": False,
+        }
+    ]
+)
 
 # Initialize FastMCP server
 mcp = FastMCP("eyemcp")
@@ -32,141 +67,591 @@ Example coordinate extraction from view hierarchy:
 - Calculate center: x = (0+720)/2, y = (0+1616)/2
 """
 
+# Route input commands through one long-lived `adb shell` process instead of
+# spawning adb (and paying its connection handshake) for every tap/keystroke.
+# Enable with EYEMCP_PERSISTENT_SHELL=1.
+PERSISTENT_SHELL = os.environ.get("EYEMCP_PERSISTENT_SHELL", "") == "1"
 
-async def take_android_screenshot(device_id: str | None = None) -> str:
+# Maximum number of one-shot adb processes running at once, so a burst of
+# concurrent tool calls cannot flood the host and the adb server with spawns
+ADB_MAX_CONCURRENCY = 4
+_adb_semaphore = asyncio.Semaphore(ADB_MAX_CONCURRENCY)
+
+# Fixed argv of the commands that take no parameters, built once
+UI_DUMP_CMD = ("adb", "exec-out", "uiautomator", "dump", "/dev/tty")
+SWIPE_UP_ARGS = ("input", "swipe", "360", "1000", "360", "500", "100")
+SWIPE_DOWN_ARGS = ("input", "swipe", "360", "500", "360", "1000", "100")
+
+# Marker line between the outputs of the batched get_device_info queries
+DEVICE_INFO_SEPARATOR = "__EYEMCP_SECTION__"
+
+# Stream buffer limit for the persistent shell, large enough for long lines
+# such as a single-line uiautomator XML dump
+SHELL_READ_LIMIT = 16 * 1024 * 1024
+
+# Upper bound (in seconds) for one command in a persistent shell session. A
+# command that outlives it is treated as hung and the session is restarted.
+SHELL_COMMAND_TIMEOUT = 30.0
+
+# Fetch the raw framebuffer (`screencap` without `-p`) and encode the PNG on the
+# host, skipping the slow on-device PNG compression. Requires Pillow.
+# Enable with EYEMCP_RAW_SCREENCAP=1.
+RAW_SCREENCAP = os.environ.get("EYEMCP_RAW_SCREENCAP", "") == "1"
+
+# PIL raw modes for the pixel formats screencap reports in its header
+# (Android's PIXEL_FORMAT_RGBA_8888, RGBX_8888 and BGRA_8888)
+SCREENCAP_RAW_MODES = {1: "RGBA", 2: "RGBX", 5: "BGRA"}
+
+
+@functools.lru_cache(maxsize=8)
+def _adb_prefix(device_id: str | None) -> tuple[str, ...]:
+    """Return the ``adb [-s SERIAL]`` prefix for commands targeting a device."""
+    return ("adb", "-s", device_id) if device_id else ("adb",)
+
+
+class AdbShellUnavailableError(RuntimeError):
+    """The persistent shell could not take a command, so it was not run."""
+
+
+class AdbShell:
+    """A long-lived ``adb shell`` process that runs commands over its stdin.
+
+    Each command is followed by an ``echo`` of a unique sentinel and the
+    command's exit status, so its output can be read back up to the sentinel.
+    Commands are serialized with a lock; the process is respawned if it exits,
+    and killed (to be respawned on the next call) if a command times out or its
+    output cannot be framed.
+    """
+
+    def __init__(self, device_id: str | None = None):
+        self.device_id = device_id
+        self._process: asyncio.subprocess.Process | None = None
+        self._lock = asyncio.Lock()
+
+    async def _ensure_process(self) -> asyncio.subprocess.Process:
+        if self._process is None or self._process.returncode is not None:
+            cmd: list[str] = [*_adb_prefix(self.device_id), "shell"]
+
+            logger.info(f"Starting persistent shell: {cmd}")
+            try:
+                self._process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT,
+                    limit=SHELL_READ_LIMIT,
+                )
+            except OSError as e:
+                raise AdbShellUnavailableError(
+                    f"Could not start ADB shell session: {e}"
+                ) from e
+        return self._process
+
+    async def run(
+        self, command: str, timeout: float = SHELL_COMMAND_TIMEOUT
+    ) -> tuple[int, str]:
+        """Run a shell command on the device.
+
+        Args:
+            command: The command line to execute in the device shell.
+            timeout: Seconds to wait for the command to finish.
+
+        Returns:
+            A tuple of the command's exit code and its combined stdout/stderr.
+
+        Raises:
+            AdbShellUnavailableError: If the session could not be started or
+                the command could not be sent, so it did not run.
+            RuntimeError: If the session dies after the command was sent, the
+                command times out, or its exit status cannot be read. The
+                command may have run. The session is restarted on the next call.
+        """
+        async with self._lock:
+            process = await self._ensure_process()
+            sentinel = f"__EYEMCP_{uuid.uuid4().hex}__".encode()
+            # The command is passed to `eval` as one quoted word, so a syntax
+            # error (e.g. an unbalanced quote) fails inside the subshell instead
+            # of swallowing the sentinel line, and stdin is closed so a command
+            # that reads input cannot consume the commands that follow it
+            process.stdin.write(
+                b"( eval "
+                + shlex.quote(command).encode()
+                + b" ) </dev/null 2>&1; echo "
+                + sentinel
+                + b"$?\n"
+            )
+            try:
+                async with asyncio.timeout(timeout):
+                    try:
+                        await process.stdin.drain()
+                    except ConnectionError as e:
+                        # The shell exited before it could read the command
+                        await self._discard(process)
+                        raise AdbShellUnavailableError(
+                            "ADB shell session is not running"
+                        ) from e
+                    output = await process.stdout.readuntil(sentinel)
+                    status = int(await process.stdout.readline())
+            except (
+                asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError,
+                ConnectionError,
+            ) as e:
+                await self._discard(process)
+                raise RuntimeError("ADB shell session terminated unexpectedly") from e
+            except TimeoutError as e:
+                await self._discard(process)
+                raise RuntimeError(
+                    f"ADB shell command timed out after {timeout} seconds"
+                ) from e
+            except ValueError as e:
+                await self._discard(process)
+                raise RuntimeError("ADB shell session returned no exit status") from e
+            except asyncio.CancelledError:
+                # The rest of the output would be read as the next command's;
+                # kill the session without waiting, as this task is cancelled
+                self._process = None
+                if process.returncode is None:
+                    process.kill()
+                raise
+
+            return status, output[: -len(sentinel)].decode()
+
+    async def _discard(self, process: asyncio.subprocess.Process) -> None:
+        """Kill a session that is out of sync; the next command starts a new one."""
+        self._process = None
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+
+    async def close(self) -> None:
+        """Terminate the shell process if it is running."""
+        if self._process is not None and self._process.returncode is None:
+            self._process.stdin.close()
+            await self._process.wait()
+        self._process = None
+
+
+# Persistent shell sessions, keyed by device serial (None for the default device)
+_adb_shells: dict[str | None, AdbShell] = {}
+
+
+def get_adb_shell(device_id: str | None = None) -> AdbShell:
+    """Return the persistent shell session for a device, creating it if needed."""
+    shell = _adb_shells.get(device_id)
+    if shell is None:
+        shell = _adb_shells[device_id] = AdbShell(device_id)
+    return shell
+
+
+async def _run_adb_shell_once(args: Sequence[str]) -> tuple[int, str]:
+    """Run ``adb shell`` in a new adb process, discarding its stdout.
+
+    Returns:
+        A tuple of (exit code, stderr output).
+    """
+    cmd: list[str] = ["adb", "shell", *args]
+    logger.opt(lazy=True).debug("Executing command: {}", lambda: cmd)
+
+    async with _adb_semaphore:
+        # Only stderr is read (for the error message); stdout goes to /dev/null
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+        _, stderr = await process.communicate()
+    return process.returncode, stderr.decode()
+
+
+async def run_adb_shell(args: Sequence[str], action: str) -> None:
+    """Run an ``adb shell`` command whose output is not needed, e.g. input events.
+
+    Uses the persistent shell session when EYEMCP_PERSISTENT_SHELL is enabled
+    (falling back to a one-shot adb process if the session cannot take the
+    command), otherwise spawns a one-shot adb process with stdout discarded.
+    Failures after the command was sent are not retried, so an input event
+    never runs twice.
+
+    Args:
+        args: Arguments to the device shell, e.g. ``["input", "tap", "10", "20"]``.
+        action: Short name of the operation, used in the error message.
+
+    Raises:
+        RuntimeError: If the command exits with a non-zero status, or the
+            persistent shell fails or times out after the command was sent.
+    """
+    if PERSISTENT_SHELL:
+        # adb joins shell arguments with spaces as well, so this is equivalent
+        command = " ".join(args)
+        logger.opt(lazy=True).debug(
+            "Executing command in persistent shell: {}", lambda: command
+        )
+        try:
+            returncode, error = await get_adb_shell().run(
+                command, timeout=SHELL_COMMAND_TIMEOUT
+            )
+        except AdbShellUnavailableError as e:
+            # The command was not sent and the session is respawned on the
+            # next call, so run this one directly
+            logger.warning(f"Persistent shell failed, running command directly: {e}")
+            returncode, error = await _run_adb_shell_once(args)
+        except RuntimeError:
+            # The command may have run and changed the screen
+            _forget_screen_state()
+            raise
+    else:
+        returncode, error = await _run_adb_shell_once(args)
+
+    # The command may have changed what is on screen
+    _forget_screen_state()
+
+    if returncode != 0:
+        raise RuntimeError(
+            f"ADB {action} command failed (exit code {returncode}): {error.strip()}"
+        )
+
+
+# In-flight screenshot captures per device, so concurrent tool calls share one
+# `screencap` instead of each spawning their own
+_inflight_screenshots: dict[str | None, asyncio.Task[bytes]] = {}
+
+# How long (in seconds) a screenshot is reused for further requests, e.g. when
+# an agent describes the screen and then taps an element on it. The cache is
+# cleared whenever a command that can change the screen is sent.
+SCREENSHOT_CACHE_TTL = 0.25
+
+# Last screenshot per device as (capture start time, PNG bytes)
+_screenshot_cache: dict[str | None, tuple[float, bytes]] = {}
+
+# How long (in seconds) a view hierarchy dump is reused. Agents often inspect
+# the screen several times in a row without acting on it in between.
+UI_DUMP_CACHE_TTL = 1.0
+
+# Last view hierarchy per device as (dump start time, XML)
+_ui_dump_cache: dict[str | None, tuple[float, str]] = {}
+
+
+# Incremented on every screen change. Captures started before the change are
+# not cached or shared, since they may show the screen as it was before.
+_screen_generation = 0
+
+
+def _forget_screen_state() -> None:
+    """Drop cached screenshots and view hierarchies after a screen change."""
+    global _screen_generation
+    _screen_generation += 1
+    _inflight_screenshots.clear()
+    _screenshot_cache.clear()
+    _ui_dump_cache.clear()
+
+
+async def take_android_screenshot_bytes(
+    device_id: str | None = None, fresh: bool = False
+) -> bytes:
     """Capture a screenshot from a connected Android device using ADB.
 
+    A screenshot taken within the last SCREENSHOT_CACHE_TTL seconds is
+    returned again, and if a capture for the same device is already running,
+    its result is shared instead of starting another one.
+
     Args:
         device_id: Optional serial number of the target device as returned by
             ``adb devices``. If omitted, the first connected device is used.
+        fresh: Always start a new capture, bypassing both of the above.
 
     Returns:
-        The screenshot encoded as a base64 *string* (PNG format). The raw PNG
-        bytes are also stored in the module-level variable ``_latest_screenshot``.
+        The raw PNG bytes of the screenshot.
     """
+    task = None
+    if not fresh:
+        cached = _screenshot_cache.get(device_id)
+        if cached is not None and time.monotonic() - cached[0] < SCREENSHOT_CACHE_TTL:
+            return cached[1]
+        task = _inflight_screenshots.get(device_id)
+
+    if task is None:
+        started = time.monotonic()
+        generation = _screen_generation
+        task = asyncio.ensure_future(_capture_screenshot_bytes(device_id))
+        _inflight_screenshots[device_id] = task
+
+        def finish(done: asyncio.Task[bytes]) -> None:
+            if _inflight_screenshots.get(device_id) is done:
+                del _inflight_screenshots[device_id]
+            # Cache the result under the time the capture started, unless the
+            # screen has changed since
+            if (
+                generation == _screen_generation
+                and not done.cancelled()
+                and done.exception() is None
+            ):
+                _screenshot_cache[device_id] = (started, done.result())
+
+        task.add_done_callback(finish)
+
+    # Shield the shared capture so one cancelled caller does not cancel it
+    # for the others
+    return await asyncio.shield(task)
+
+
+async def _capture_screenshot_bytes(device_id: str | None = None) -> bytes:
+    """Run ``screencap`` on the device and return the PNG bytes."""
+    raw = RAW_SCREENCAP and PILImage is not None
+
+    # Build the adb command: `adb [-s SERIAL] exec-out screencap [-p]`
+    cmd: list[str] = [*_adb_prefix(device_id), "exec-out", "screencap"]
+    if not raw:
+        cmd.append("-p")
+
+    async with _adb_semaphore:
+        # Execute the command asynchronously and capture stdout/stderr.
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
 
-    # Build the adb command: `adb [-s SERIAL] exec-out screencap -p`
-    cmd: list[str] = ["adb"]
-    if device_id:
-        cmd += ["-s", device_id]
-    cmd += ["exec-out", "screencap", "-p"]
-
-    # Execute the command asynchronously and capture stdout/stderr.
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-
-    stdout, stderr = await process.communicate()
+        stdout, stderr = await process.communicate()
 
     if process.returncode != 0:
         raise RuntimeError(
             f"ADB screenshot command failed (exit code {process.returncode}): "
             f"{stderr.decode().strip()}"
         )
-    return base64.b64encode(stdout).decode()
+    if raw:
+        return await asyncio.to_thread(raw_screencap_to_png, stdout)
+    return stdout
+
+
+def raw_screencap_to_png(data: bytes) -> bytes:
+    """Encode the raw output of ``screencap`` (without ``-p``) as PNG.
+
+    The output starts with a header of little-endian uint32 ``width``,
+    ``height`` and ``format`` (followed by a ``colorspace`` field on
+    Android 9+), then the pixels at 4 bytes each.
+
+    Args:
+        data: The raw screencap output.
+
+    Returns:
+        The screenshot as PNG bytes.
+    """
+    if len(data) < 12:
+        raise RuntimeError(f"Truncated screencap output ({len(data)} bytes)")
+    width, height, pixel_format = struct.unpack_from("<III", data)
+    mode = SCREENCAP_RAW_MODES.get(pixel_format)
+    if mode is None:
+        raise RuntimeError(f"Unsupported screencap pixel format: {pixel_format}")
+
+    # The header is 12 or 16 bytes depending on the Android version
+    size = width * height * 4
+    if len(data) < 12 + size:
+        raise RuntimeError(
+            f"Truncated screencap output ({len(data)} bytes for a "
+            f"{width}x{height} frame)"
+        )
+    pixels = data[len(data) - size :]
+    # RGBX has no alpha, so drop the padding byte and encode it as RGB
+    # (PNG cannot store an RGBX image)
+    image_mode = "RGB" if mode == "RGBX" else "RGBA"
+    img = PILImage.frombytes(image_mode, (width, height), pixels, "raw", mode)
+
+    # Fast compression: the PNG is usually decoded again right away
+    png = io.BytesIO()
+    img.save(png, "PNG", compress_level=1)
+    return png.getvalue()
+
+
+async def take_android_screenshot(device_id: str | None = None) -> str:
+    """Capture a screenshot from a connected Android device using ADB.
+
+    Args:
+        device_id: Optional serial number of the target device as returned by
+            ``adb devices``. If omitted, the first connected device is used.
+
+    Returns:
+        The screenshot encoded as a base64 *string* (PNG format). Internal
+        callers should prefer ``take_android_screenshot_bytes``, which skips
+        the encoding.
+    """
+    screenshot = await take_android_screenshot_bytes(device_id)
+
+    # Encode in a worker thread so a large PNG does not stall other tool calls
+    return await asyncio.to_thread(_encode_base64, screenshot)
+
+
+def _encode_base64(data: bytes) -> str:
+    """Encode bytes as a base64 ASCII string."""
+    return b64encode(data).decode("ascii")
+
+
+def _strip_dump_trailer(xml: str) -> str:
+    """Drop the "UI hierchary dumped to: /dev/tty" line printed after the XML."""
+    xml = xml.strip()
+    end = xml.rfind("</hierarchy>")
+    if end != -1:
+        xml = xml[: end + len("</hierarchy>")]
+    return xml
 
 
 @mcp.tool()
 async def inspect_screen_structure() -> str:
     """Get the complete UI structure of the Android screen as a view hierarchy. This is the PREFERRED method for understanding screen content and finding elements to interact with. Returns XML data containing all UI elements with their properties, bounds, and text content. Use this FIRST before trying vision-based tools. Response time: ~200ms"""
-    cmd: list[str] = ["adb"]
-    cmd += ["exec-out", "uiautomator", "dump", "/dev/tty"]
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
+    started = time.monotonic()
+    generation = _screen_generation
+    cached = _ui_dump_cache.get(None)
+    if cached is not None and started - cached[0] < UI_DUMP_CACHE_TTL:
+        return cached[1]
+
+    async with _adb_semaphore:
+        process = await asyncio.create_subprocess_exec(
+            *UI_DUMP_CMD,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
 
-    stdout, stderr = await process.communicate()
+        stdout, stderr = await process.communicate()
 
     if process.returncode != 0:
         raise RuntimeError(
             f"ADB uiautomator dump command failed (exit code {process.returncode}): "
             f"{stderr.decode().strip()}"
         )
-    return stdout.decode().strip()
 
+    xml = _strip_dump_trailer(stdout.decode())
 
-@mcp.tool()
-async def tap_screen(x: int, y: int) -> str:
-    """Tap at specific coordinates on the Android screen. Use coordinates obtained from inspect_screen_structure for reliable interaction. Screen dimensions: 720x1616 pixels, origin (0,0) at top-left. Response time: ~100ms"""
+    if generation == _screen_generation:
+        _ui_dump_cache[None] = (started, xml)
+    return xml
 
-    if x < 0 or y < 0:
-        raise ValueError("Coordinates must be non-negative integers.")
 
-    cmd: list[str] = ["adb"]
-    cmd += ["shell", "input", "tap", str(x), str(y)]
+# `bounds="[left,top][right,bottom]"` attribute of a view hierarchy node
+BOUNDS_PATTERN = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
 
-    logger.info(f"Executing command: {cmd}")
+# Words ignored when comparing a description with a node label, so that
+# "the Login button" matches a node labelled "Login"
+GENERIC_DESCRIPTION_WORDS = frozenset(
+    {"a", "an", "the", "button", "icon", "field", "link", "tab", "label", "image"}
+)
 
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
+# Confidence reported for hierarchy matches. A label match does not prove the
+# description meant that node, so it stays below a certain hit.
+HIERARCHY_MATCH_CONFIDENCE = 0.9
 
-    stdout, stderr = await process.communicate()
 
-    if process.returncode != 0:
-        raise RuntimeError(
-            f"ADB tap command failed (exit code {process.returncode}): "
-            f"{stderr.decode().strip()}"
-        )
-    _ = stdout
-    return f"Tapped at ({x}, {y})."
+def _match_key(text: str) -> str:
+    """Normalize a label or description for comparison.
 
+    Lowercases the text, drops punctuation and generic words such as
+    "the" or "button", and joins the remaining words with single spaces.
+    """
+    words = re.findall(r"\w+", text.lower())
+    return " ".join(word for word in words if word not in GENERIC_DESCRIPTION_WORDS)
 
-@mcp.tool()
-async def swipe_up() -> str:
-    """Perform a standard swipe up gesture from (360,1000) to (360,500). This is useful for scrolling down content. The swipe occurs in 100ms. Response time: ~200ms"""
 
-    cmd: list[str] = ["adb"]
-    cmd += ["shell", "input", "swipe", "360", "1000", "360", "500", "100"]
+@functools.lru_cache(maxsize=8)
+def _hierarchy_labels(xml: str) -> tuple[tuple[str, str, int, int], ...]:
+    """Extract the labels of the nodes in a view hierarchy dump.
 
-    logger.info(f"Executing command: {cmd}")
+    Each node contributes its ``text``, ``content-desc`` and the name part of
+    its ``resource-id`` (underscores read as spaces). Parsed dumps are cached,
+    since an unchanged screen produces the same XML.
 
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
+    Args:
+        xml: Output of ``inspect_screen_structure``.
 
-    stdout, stderr = await process.communicate()
+    Returns:
+        Tuples of (match key, label, center x, center y), where the match
+        key is the label normalized by ``_match_key``.
+    """
+    labels = []
+    for node in ET.fromstring(_strip_dump_trailer(xml)).iter("node"):
+        bounds = BOUNDS_PATTERN.fullmatch(node.get("bounds", ""))
+        if bounds is None:
+            continue
+        left, top, right, bottom = map(int, bounds.groups())
+        x, y = (left + right) // 2, (top + bottom) // 2
+
+        resource_id = node.get("resource-id", "").rpartition(":id/")[2]
+        for label in (
+            node.get("text", ""),
+            node.get("content-desc", ""),
+            resource_id.replace("_", " "),
+        ):
+            label = label.strip()
+            key = _match_key(label)
+            if key:
+                labels.append((key, label, x, y))
+    return tuple(labels)
+
+
+def find_element_in_hierarchy(xml: str, description: str) -> dict | None:
+    """Locate an element described in words using the view hierarchy alone.
+
+    An element matches only if the description is essentially one of its
+    labels: the two must be equal once case, punctuation and generic words
+    such as "the" or "button" are ignored. Relational descriptions like
+    "the icon left of Settings" therefore never match the landmark they
+    mention. The match must also point at a single position; anything
+    ambiguous returns None so the caller can fall back to vision.
 
-    if process.returncode != 0:
-        raise RuntimeError(
-            f"ADB swipe up command failed (exit code {process.returncode}): "
-            f"{stderr.decode().strip()}"
-        )
-    _ = stdout
-    return "Performed swipe up from (360, 1000) to (360, 500) in 100ms."
+    Args:
+        xml: Output of ``inspect_screen_structure``.
+        description: Description of the element, e.g. "the Login button".
+
+    Returns:
+        A dict with ``x``, ``y``, ``confidence`` and ``element_description``
+        (the same shape as the vision lookup), or None if there is no unique match.
+    """
+    try:
+        labels = _hierarchy_labels(xml)
+    except ET.ParseError as e:
+        logger.warning(f"Could not parse view hierarchy: {e}")
+        return None
+
+    wanted = _match_key(description)
+    matches = [(label, x, y) for key, label, x, y in labels if key == wanted]
+    if len({(x, y) for _, x, y in matches}) != 1:
+        return None
+
+    label, x, y = matches[0]
+    return {
+        "x": x,
+        "y": y,
+        "confidence": HIERARCHY_MATCH_CONFIDENCE,
+        "element_description": label,
+    }
 
 
 @mcp.tool()
-async def swipe_down() -> str:
-    """Perform a standard swipe down gesture from (360,500) to (360,1000). This is useful for scrolling up content. The swipe occurs in 100ms. Response time: ~200ms"""
+async def tap_screen(x: int, y: int) -> str:
+    """Tap at specific coordinates on the Android screen. Use coordinates obtained from inspect_screen_structure for reliable interaction. Screen dimensions: 720x1616 pixels, origin (0,0) at top-left. Response time: ~100ms"""
 
-    cmd: list[str] = ["adb"]
-    cmd += ["shell", "input", "swipe", "360", "500", "360", "1000", "100"]
+    if x < 0 or y < 0:
+        raise ValueError("Coordinates must be non-negative integers.")
 
-    logger.info(f"Executing command: {cmd}")
+    await run_adb_shell(["input", "tap", str(x), str(y)], "tap")
+    return f"Tapped at ({x}, {y})."
 
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
 
-    stdout, stderr = await process.communicate()
+@mcp.tool()
+async def swipe_up() -> str:
+    """Perform a standard swipe up gesture from (360,1000) to (360,500). This is useful for scrolling down content. The swipe occurs in 100ms. Response time: ~200ms"""
 
-    if process.returncode != 0:
-        raise RuntimeError(
-            f"ADB swipe down command failed (exit code {process.returncode}): "
-            f"{stderr.decode().strip()}"
-        )
-    _ = stdout
+    await run_adb_shell(SWIPE_UP_ARGS, "swipe up")
+    return "Performed swipe up from (360, 1000) to (360, 500) in 100ms."
+
+
+@mcp.tool()
+async def swipe_down() -> str:
+    """Perform a standard swipe down gesture from (360,500) to (360,1000). This is useful for scrolling up content. The swipe occurs in 100ms. Response time: ~200ms"""
+
+    await run_adb_shell(SWIPE_DOWN_ARGS, "swipe down")
     return "Performed swipe down from (360, 500) to (360, 1000) in 100ms."
 
 
@@ -177,25 +662,9 @@ async def custom_swipe(x1: int, y1: int, x2: int, y2: int) -> str:
     if x1 < 0 or y1 < 0 or x2 < 0 or y2 < 0:
         raise ValueError("Coordinates must be non-negative integers.")
 
-    cmd: list[str] = ["adb"]
-    cmd += ["shell", "input", "swipe", str(x1), str(y1), str(x2), str(y2), "100"]
-
-    logger.info(f"Executing command: {cmd}")
-
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
+    await run_adb_shell(
+        ["input", "swipe", str(x1), str(y1), str(x2), str(y2), "100"], "custom swipe"
     )
-
-    stdout, stderr = await process.communicate()
-
-    if process.returncode != 0:
-        raise RuntimeError(
-            f"ADB custom swipe command failed (exit code {process.returncode}): "
-            f"{stderr.decode().strip()}"
-        )
-    _ = stdout
     return f"Performed custom swipe from ({x1}, {y1}) to ({x2}, {y2}) in 100ms."
 
 
@@ -205,50 +674,91 @@ async def input_text(text: str) -> str:
     if not text:
         raise ValueError("Text cannot be empty.")
 
-    cmd: list[str] = ["adb"]
-    cmd += ["shell", "input", "text", text]
-
-    logger.info(f"Executing command: {cmd}")
-
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
+    # The device shell re-parses the command line, so quote the text and use
+    # `input text`'s %s escape for spaces to send it as a single argument
+    await run_adb_shell(
+        ["input", "text", shlex.quote(text.replace(" ", "%s"))], "input text"
     )
+    return f"Sent keystrokes '{text}' to device."
 
-    stdout, stderr = await process.communicate()
 
-    if process.returncode != 0:
-        raise RuntimeError(
-            f"ADB input text command failed (exit code {process.returncode}): "
-            f"{stderr.decode().strip()}"
-        )
-    _ = stdout
-    return f"Sent keystrokes '{text}' to device."
+@mcp.tool()
+async def execute_adb_batch(commands: list[str], validate_after: bool = True) -> str:
+    """Run a sequence of device shell commands in a single tool call, e.g. ["input keyevent KEYCODE_HOME", "sleep 1", "am start -n com.android.settings/.Settings", "input tap 360 800"]. Commands are shell commands WITHOUT the 'adb shell' prefix and run in order through one adb shell session; a "sleep N" entry waits N seconds between steps. Execution stops at the first failing command; a command still running after 30 seconds counts as failed. If validate_after is true, the view hierarchy (as from inspect_screen_structure) is captured once at the end. Use this for scripted flows to avoid one round trip per action. Response time: sum of commands plus ~200ms"""
+    if not commands:
+        raise ValueError("Commands cannot be empty.")
+
+    # Reuse the persistent session if enabled, otherwise open one just for this batch
+    shell = get_adb_shell() if PERSISTENT_SHELL else AdbShell()
+    results: list[str] = []
+    try:
+        for command in commands:
+            command = command.strip()
+            sleep_match = re.fullmatch(r"sleep\s+(\d+(?:\.\d+)?)", command)
+            if sleep_match:
+                await asyncio.sleep(float(sleep_match.group(1)))
+                results.append(f"$ {command}")
+                continue
+
+            logger.opt(lazy=True).debug("Executing batch command: {}", lambda: command)
+            try:
+                returncode, output = await shell.run(
+                    command, timeout=SHELL_COMMAND_TIMEOUT
+                )
+            except RuntimeError as e:
+                raise RuntimeError(f"ADB batch command '{command}' failed: {e}") from e
+            if returncode != 0:
+                raise RuntimeError(
+                    f"ADB batch command '{command}' failed (exit code {returncode}): "
+                    f"{output.strip()}"
+                )
+            results.append(f"$ {command}\n{output.strip()}".rstrip())
+    finally:
+        _forget_screen_state()
+        if not PERSISTENT_SHELL:
+            await shell.close()
+
+    if validate_after:
+        results.append(await inspect_screen_structure())
+
+    return "\n".join(results)
 
 
 @mcp.tool()
 async def describe_visible_elements() -> str:
     """FALLBACK TOOL: Use vision AI to describe interactive elements when inspect_screen_structure doesn't provide enough information. This is SLOWER and LESS RELIABLE than inspect_screen_structure. Only use when the view hierarchy lacks necessary details (e.g., custom-drawn elements, images without proper labels). Response time: 2-3 seconds"""
-    screenshot_b64: str = await take_android_screenshot()
+    screenshot = await take_android_screenshot_bytes()
 
-    return describe_screen_interactions(screenshot_b64)
+    return await asyncio.to_thread(describe_screen_interactions, screenshot)
 
 
 @mcp.tool()
 async def query_visual_details(prompt: str) -> str:
     """FALLBACK TOOL: Ask specific questions about visual appearance when such details aren't available in the view hierarchy (e.g., colors, visual styles, image content). This is a FALLBACK tool - prefer inspect_screen_structure for structural information. Response time: 2-3 seconds"""
-    screenshot_b64: str = await take_android_screenshot()
+    screenshot = await take_android_screenshot_bytes()
 
-    return run_prompt_against_screen(screenshot_b64, prompt)
+    return await asyncio.to_thread(run_prompt_against_screen, screenshot, prompt)
 
 
 @mcp.tool()
 async def tap_element_fallback(description: str) -> str:
-    """LAST RESORT: Find and tap an element using vision AI when inspect_screen_structure cannot locate it. This is UNRELIABLE and SLOW. Always try inspect_screen_structure + tap_screen first. Common valid uses: tapping on canvas-drawn elements, game interfaces, or custom graphics. Response time: 3-4 seconds"""
-    # First, find the element coordinates
-    screenshot_b64: str = await take_android_screenshot()
-    element_info = find_element_coordinates_by_description(screenshot_b64, description)
+    """LAST RESORT: Find and tap an element using vision AI when inspect_screen_structure cannot locate it. This is UNRELIABLE and SLOW. Always try inspect_screen_structure + tap_screen first. Common valid uses: tapping on canvas-drawn elements, game interfaces, or custom graphics. If the description is just one element's text, content description or resource id (e.g. "the Login button"), that element is tapped without vision. Response time: 3-4 seconds"""
+    try:
+        element_info = find_element_in_hierarchy(
+            await inspect_screen_structure(), description
+        )
+    except RuntimeError as e:
+        logger.warning(f"View hierarchy unavailable, using vision: {e}")
+        element_info = None
+
+    if element_info is None:
+        # Find the element coordinates with vision. The vision client is
+        # synchronous, so run it in a worker thread to keep the event loop
+        # responsive.
+        screenshot = await take_android_screenshot_bytes()
+        element_info = await asyncio.to_thread(
+            find_element_coordinates_by_description, screenshot, description
+        )
 
     # Then tap at those coordinates
     x, y = element_info["x"], element_info["y"]
@@ -259,30 +769,81 @@ async def tap_element_fallback(description: str) -> str:
 
 
 @mcp.tool()
-async def capture_screenshot() -> Image:
-    """Capture a raw screenshot image. ONLY use this if you have vision capabilities and need to see the actual visual representation. For understanding screen structure and interaction, use inspect_screen_structure instead. Response time: ~500ms"""
-    # Build the adb command: `adb exec-out screencap -p`
-    cmd: list[str] = ["adb", "exec-out", "screencap", "-p"]
-
-    # Execute the command asynchronously and capture stdout
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
+async def locate_elements_fallback(descriptions: list[str]) -> list[dict]:
+    """FALLBACK TOOL: Find the coordinates of several elements at once when inspect_screen_structure cannot locate them. Descriptions that are just one element's text, content description or resource id (e.g. "the Login button") are resolved from the view hierarchy; all others are looked up with ONE vision request instead of one per element. Returns one {x, y, confidence, element_description} object per description, in order, or an object with an "error" field for elements that were not found. Does not tap anything. Response time: 3-4 seconds"""
+    if not descriptions:
+        raise ValueError("Descriptions cannot be empty.")
+
+    try:
+        xml = await inspect_screen_structure()
+        elements = [find_element_in_hierarchy(xml, d) for d in descriptions]
+    except RuntimeError as e:
+        logger.warning(f"View hierarchy unavailable, using vision: {e}")
+        elements = [None] * len(descriptions)
+
+    missing = [d for d, element in zip(descriptions, elements) if element is None]
+    if not missing:
+        return elements
+
+    screenshot = await take_android_screenshot_bytes()
+    found = iter(
+        await asyncio.to_thread(find_multiple_element_coordinates, screenshot, missing)
     )
+    return [element if element is not None else next(found) for element in elements]
 
-    stdout, stderr = await process.communicate()
 
-    if process.returncode != 0:
-        raise RuntimeError(
-            f"ADB screenshot command failed (exit code {process.returncode}): "
-            f"{stderr.decode().strip()}"
-        )
+@mcp.tool()
+async def capture_screenshot() -> Image:
+    """Capture a raw screenshot image. ONLY use this if you have vision capabilities and need to see the actual visual representation. For understanding screen structure and interaction, use inspect_screen_structure instead. Response time: ~500ms"""
+    stdout = await take_android_screenshot_bytes()
 
     # Return the raw PNG binary data wrapped in an Image object
     return Image(data=stdout, format="PNG")
 
 
+# Global adb options that take a value, e.g. `-s SERIAL`
+ADB_OPTIONS_WITH_VALUE = frozenset({"-s", "-t", "-H", "-P", "-L"})
+
+
+def _split_adb_command(command: str) -> list[str]:
+    """Split an adb command line (without the ``adb`` prefix) into arguments.
+
+    Arguments are split like a shell, so quoted arguments keep their spaces.
+    The command after ``shell`` is the exception: adb joins shell arguments
+    with spaces and the device shell parses them, so it is passed on as one
+    argument, exactly as written. Quoting, pipes and variables in it are then
+    interpreted once, by the device shell.
+
+    Args:
+        command: The command, e.g. ``-s SERIAL shell dumpsys battery | grep level``.
+
+    Returns:
+        The arguments to pass after ``adb``.
+    """
+    lexer = shlex.shlex(command, posix=True)
+    lexer.whitespace_split = True
+
+    args = []
+    option_value = False
+    while (token := lexer.get_token()) is not None:
+        args.append(token)
+        if option_value:
+            option_value = False
+        elif token in ADB_OPTIONS_WITH_VALUE:
+            option_value = True
+        elif not token.startswith("-"):
+            # The first other argument is the adb subcommand
+            if token == "shell":
+                # The lexer has consumed the separator after `shell`, so the
+                # rest of the stream is the device command
+                device_command = lexer.instream.read().strip()
+                if device_command:
+                    args.append(device_command)
+            break
+    args.extend(lexer)
+    return args
+
+
 @mcp.tool()
 async def run_adb_command(command: str) -> str:
     """Execute an arbitrary ADB command and return its output.
@@ -302,12 +863,17 @@ async def run_adb_command(command: str) -> str:
     if not command or not command.strip():
         raise ValueError("Command cannot be empty.")
 
+    args = _split_adb_command(command)
+    if args[0] == "adb":
+        raise ValueError("Command should not include the 'adb' prefix.")
+
     # Build the full command with adb prefix
-    cmd: list[str] = ["adb"]
-    cmd.extend(command.split())
+    cmd: list[str] = ["adb", *args]
 
     logger.info(f"Executing arbitrary ADB command: {cmd}")
 
+    # Not limited by _adb_semaphore: arbitrary commands such as `logcat` or
+    # `shell getevent` may never finish and would hold a slot indefinitely
     process = await asyncio.create_subprocess_exec(
         *cmd,
         stdout=asyncio.subprocess.PIPE,
@@ -316,6 +882,9 @@ async def run_adb_command(command: str) -> str:
 
     stdout, stderr = await process.communicate()
 
+    # Arbitrary commands may change what is on screen
+    _forget_screen_state()
+
     if process.returncode != 0:
         error_msg = stderr.decode().strip()
         raise RuntimeError(
@@ -346,21 +915,57 @@ async def get_device_info() -> dict:
     """
     properties = {}
 
-    # Helper function to execute ADB commands and get output
-    async def adb_get_prop(command):
-        proc = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        stdout, stderr = await proc.communicate()
-        if proc.returncode != 0:
-            logger.warning(f"Command failed: {command}")
-            return ""
-        return stdout.decode().strip()
+    # Run every query in one `adb shell` round trip, separated by a marker line
+    queries = [
+        "wm size",
+        "getprop ro.build.version.release",
+        "getprop ro.build.version.sdk",
+        "getprop ro.product.model",
+        "getprop ro.product.manufacturer",
+        "getprop ro.build.id",
+        "dumpsys battery",
+        "cat /proc/meminfo",
+    ]
+    script = f"; echo {DEVICE_INFO_SEPARATOR}; ".join(queries)
+
+    output = None
+    if PERSISTENT_SHELL:
+        try:
+            returncode, output = await get_adb_shell().run(script)
+        except RuntimeError as e:
+            # The session is respawned on the next call; run this one directly
+            logger.warning(f"Persistent shell failed, running query directly: {e}")
+
+    if output is None:
+        async with _adb_semaphore:
+            proc = await asyncio.create_subprocess_exec(
+                "adb",
+                "shell",
+                script,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            stdout, stderr = await proc.communicate()
+        returncode, output = proc.returncode, stdout.decode()
+
+    if returncode != 0:
+        logger.warning(f"Device info query failed (exit code {returncode})")
+
+    # Missing sections (e.g. adb failed outright) are treated as empty output
+    sections = [section.strip() for section in output.split(DEVICE_INFO_SEPARATOR)]
+    sections += [""] * (len(queries) - len(sections))
+    (
+        dimensions_str,
+        android_version,
+        sdk_version,
+        device_model,
+        manufacturer,
+        build_id,
+        battery_info,
+        mem_info,
+    ) = sections[: len(queries)]
 
     # Get screen dimensions
-    dimensions_str = await adb_get_prop(["adb", "shell", "wm", "size"])
     if "size:" in dimensions_str:
         dimensions = dimensions_str.split("size:")[1].strip().split("x")
         if len(dimensions) == 2:
@@ -370,45 +975,29 @@ async def get_device_info() -> dict:
             }
 
     # Get Android version
-    android_version = await adb_get_prop(
-        ["adb", "shell", "getprop", "ro.build.version.release"]
-    )
-    sdk_version = await adb_get_prop(
-        ["adb", "shell", "getprop", "ro.build.version.sdk"]
-    )
     properties["android_version"] = {"release": android_version, "sdk": sdk_version}
 
     # Get device model and manufacturer
-    properties["device_model"] = await adb_get_prop(
-        ["adb", "shell", "getprop", "ro.product.model"]
-    )
-    properties["manufacturer"] = await adb_get_prop(
-        ["adb", "shell", "getprop", "ro.product.manufacturer"]
-    )
-    properties["build_id"] = await adb_get_prop(
-        ["adb", "shell", "getprop", "ro.build.id"]
-    )
+    properties["device_model"] = device_model
+    properties["manufacturer"] = manufacturer
+    properties["build_id"] = build_id
 
-    # Get battery info
-    battery_level = await adb_get_prop(
-        ["adb", "shell", "dumpsys", "battery", "|", "grep", "level"]
-    )
-    battery_status = await adb_get_prop(
-        ["adb", "shell", "dumpsys", "battery", "|", "grep", "status"]
-    )
+    # Get battery info from the `key: value` lines of `dumpsys battery`
+    battery = {}
+    for line in battery_info.splitlines():
+        key, _, value = line.partition(":")
+        battery[key.strip()] = value.strip()
 
     properties["battery"] = {}
-    if "level" in battery_level:
+    if "level" in battery:
         try:
-            properties["battery"]["level"] = int(
-                battery_level.split("level:")[1].strip()
-            )
-        except (IndexError, ValueError):
+            properties["battery"]["level"] = int(battery["level"])
+        except ValueError:
             properties["battery"]["level"] = -1
 
-    if "status" in battery_status:
+    if "status" in battery:
         try:
-            status_code = int(battery_status.split("status:")[1].strip())
+            status_code = int(battery["status"])
             # Status codes: 1=unknown, 2=charging, 3=discharging, 4=not charging, 5=full
             status_map = {
                 1: "unknown",
@@ -418,11 +1007,10 @@ async def get_device_info() -> dict:
                 5: "full",
             }
             properties["battery"]["status"] = status_map.get(status_code, "unknown")
-        except (IndexError, ValueError):
+        except ValueError:
             properties["battery"]["status"] = "unknown"
 
     # Get memory information
-    mem_info = await adb_get_prop(["adb", "shell", "cat", "/proc/meminfo"])
     properties["memory"] = {}
 
     if mem_info:
@@ -447,5 +1035,13 @@ async def get_device_info() -> dict:
 
 
 if __name__ == "__main__":
+    # Use uvloop's event loop, which has faster subprocess pipes, when installed
+    try:
+        import uvloop
+
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+
     # Initialize and run the server
     mcp.run(transport="stdio")
@@ -1,17 +1,39 @@
 """
 Pytest configuration file for EyeMCP tests.
 
-This file contains fixtures and configuration for the pytest test suite.
+This file contains fixtures shared by the pytest test suite. The asyncio event
+loop is provided by pytest-asyncio, with its scope set in pyproject.toml, and
+runs on uvloop when it is installed, matching the server.
 """
 
-import pytest
 import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+
+@pytest.fixture(scope="session")
+def event_loop_policy():
+    """Use uvloop's event loop policy for async tests when uvloop is installed."""
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.DefaultEventLoopPolicy()
+    return uvloop.EventLoopPolicy()
 
 
-# Configure pytest to handle asyncio tests
 @pytest.fixture
-def event_loop():
-    """Create an instance of the default event loop for each test case."""
-    loop = asyncio.get_event_loop_policy().new_event_loop()
-    yield loop
-    loop.close()
+def adb_process(monkeypatch):
+    """Mock `asyncio.create_subprocess_exec` to return one successful adb process.
+
+    Returns the (process, exec mock) pair. Tests adjust ``returncode`` or the
+    ``communicate`` return value on the process in place.
+    """
+    # One-shot adb calls only use returncode and communicate(), so a plain
+    # namespace is enough for the process
+    process = SimpleNamespace(
+        returncode=0, communicate=AsyncMock(return_value=(b"", b""))
+    )
+    mock_exec = AsyncMock(return_value=process)
+    monkeypatch.setattr("asyncio.create_subprocess_exec", mock_exec)
+    return process, mock_exec
@@ -0,0 +1,335 @@
+import asyncio
+import re
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock
+from main import (
+    AdbShell,
+    get_adb_shell,
+    tap_screen,
+    input_text,
+    swipe_up,
+    execute_adb_batch,
+    get_device_info,
+)
+
+
+class FakeShellStdin:
+    """Stand-in for the shell's stdin that answers each command on stdout."""
+
+    def __init__(self, stdout: asyncio.StreamReader, output: bytes, status: int):
+        self.stdout = stdout
+        self.output = output
+        self.status = status
+        self.commands: list[bytes] = []
+
+    def write(self, data: bytes) -> None:
+        self.commands.append(data)
+        sentinel = re.search(rb"echo (\S+)\$\?", data).group(1)
+        self.stdout.feed_data(
+            self.output + sentinel + str(self.status).encode() + b"\n"
+        )
+
+    async def drain(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def make_shell_process(output: bytes = b"", status: int = 0):
+    """Create a mock `adb shell` process that answers every command."""
+    stdout = asyncio.StreamReader()
+    return SimpleNamespace(
+        returncode=None,
+        stdout=stdout,
+        stdin=FakeShellStdin(stdout, output, status),
+        wait=AsyncMock(return_value=0),
+        kill=lambda: None,
+    )
+
+
+@pytest.fixture
+def mock_exec(monkeypatch):
+    """Mock `asyncio.create_subprocess_exec`; tests set the process it returns."""
+    mock = AsyncMock()
+    monkeypatch.setattr("asyncio.create_subprocess_exec", mock)
+    return mock
+
+
+@pytest.fixture
+def local_shell(monkeypatch):
+    """Run persistent shell sessions on a local `sh` instead of `adb shell`."""
+    spawn = asyncio.create_subprocess_exec
+
+    async def spawn_sh(*cmd, **kwargs):
+        return await spawn("sh", **kwargs)
+
+    monkeypatch.setattr("asyncio.create_subprocess_exec", spawn_sh)
+
+
+async def test_adb_shell_run(mock_exec):
+    """Test that AdbShell.run returns the command output and exit code."""
+    process = make_shell_process(output=b"hello\n")
+    mock_exec.return_value = process
+
+    shell = AdbShell()
+    returncode, output = await shell.run("echo hello")
+
+    # Check that a single `adb shell` process was spawned
+    mock_exec.assert_called_once()
+    assert mock_exec.call_args[0] == ("adb", "shell")
+
+    # Check that the command was written to the shell
+    assert process.stdin.commands[0].startswith(b"( eval 'echo hello' )")
+
+    assert returncode == 0
+    assert output == "hello\n"
+
+
+async def test_adb_shell_run_with_device_id(mock_exec):
+    """Test that AdbShell targets the given device serial."""
+    mock_exec.return_value = make_shell_process()
+
+    await AdbShell("test_device").run("true")
+
+    assert mock_exec.call_args[0] == ("adb", "-s", "test_device", "shell")
+
+
+async def test_adb_shell_reuses_process(mock_exec):
+    """Test that consecutive commands share one shell process."""
+    process = make_shell_process()
+    mock_exec.return_value = process
+
+    shell = AdbShell()
+    await shell.run("input tap 1 2")
+    await shell.run("input tap 3 4")
+
+    mock_exec.assert_called_once()
+    assert len(process.stdin.commands) == 2
+
+
+async def test_adb_shell_session_terminated(mock_exec):
+    """Test that AdbShell.run raises if the shell exits mid-command."""
+    process = make_shell_process()
+    process.stdin.write = lambda data: process.stdout.feed_eof()
+    mock_exec.return_value = process
+
+    with pytest.raises(RuntimeError, match="session terminated unexpectedly"):
+        await AdbShell().run("input tap 1 2")
+
+
+async def test_adb_shell_syntax_error(local_shell):
+    """Test that a command with a syntax error fails without breaking the session."""
+    shell = AdbShell()
+    try:
+        returncode, _ = await shell.run("echo 'x")
+        assert returncode != 0
+
+        assert await shell.run("echo ok") == (0, "ok\n")
+    finally:
+        await shell.close()
+
+
+async def test_adb_shell_command_reading_stdin(local_shell):
+    """Test that a command reading stdin cannot consume the session's input."""
+    shell = AdbShell()
+    try:
+        await shell.run("read x")
+
+        assert await shell.run("echo ok") == (0, "ok\n")
+    finally:
+        await shell.close()
+
+
+async def test_adb_shell_timeout(local_shell):
+    """Test that a hung command times out and the session is restarted."""
+    shell = AdbShell()
+    try:
+        with pytest.raises(RuntimeError, match="timed out"):
+            await shell.run("sleep 1", timeout=0.2)
+
+        assert await shell.run("echo ok") == (0, "ok\n")
+    finally:
+        await shell.close()
+
+
+async def test_tap_screen_persistent_shell(mock_exec):
+    """Test that tap_screen uses the persistent shell when enabled."""
+    process = make_shell_process()
+    mock_exec.return_value = process
+
+    with (
+        patch("main.PERSISTENT_SHELL", True),
+        patch.dict("main._adb_shells", clear=True),
+    ):
+        result = await tap_screen(100, 200)
+        await tap_screen(300, 400)
+
+        # Check that both taps went through one shell process
+        mock_exec.assert_called_once()
+        assert process.stdin.commands[0].startswith(b"( eval 'input tap 100 200' )")
+        assert process.stdin.commands[1].startswith(b"( eval 'input tap 300 400' )")
+
+        assert "Tapped at (100, 200)" in result
+
+
+async def test_swipe_up_persistent_shell_fallback(mock_exec):
+    """Test that a command falls back to a one-shot adb call if it cannot be sent."""
+    process = make_shell_process()
+    process.stdin.drain = AsyncMock(side_effect=ConnectionResetError)
+
+    one_shot = SimpleNamespace(
+        returncode=0, communicate=AsyncMock(return_value=(None, b""))
+    )
+    mock_exec.side_effect = [process, one_shot]
+
+    with (
+        patch("main.PERSISTENT_SHELL", True),
+        patch.dict("main._adb_shells", clear=True),
+    ):
+        result = await swipe_up()
+
+        # Check that the swipe was retried as `adb shell input swipe ...`
+        assert mock_exec.call_count == 2
+        assert mock_exec.call_args[0][:4] == ("adb", "shell", "input", "swipe")
+
+        assert "Performed swipe up" in result
+
+
+@pytest.mark.parametrize("error", ["died", "timeout"])
+async def test_tap_screen_persistent_shell_not_retried(mock_exec, error):
+    """Test that a command is not run again if the session fails after it was sent."""
+    process = make_shell_process()
+    if error == "died":
+        process.stdin.write = lambda data: process.stdout.feed_eof()
+    else:
+        process.stdin.write = lambda data: None
+    mock_exec.return_value = process
+
+    with (
+        patch("main.PERSISTENT_SHELL", True),
+        patch("main.SHELL_COMMAND_TIMEOUT", 0.1),
+        patch.dict("main._adb_shells", clear=True),
+    ):
+        with pytest.raises(RuntimeError, match="ADB shell"):
+            await tap_screen(100, 200)
+
+        # Check that no one-shot adb call repeated the tap
+        mock_exec.assert_called_once()
+
+
+async def test_get_device_info_persistent_shell_fallback(mock_exec):
+    """Test that get_device_info retries with a one-shot adb call if the session dies."""
+    process = make_shell_process()
+    process.stdin.write = lambda data: process.stdout.feed_eof()
+
+    one_shot = SimpleNamespace(
+        returncode=0,
+        communicate=AsyncMock(return_value=(b"Physical size: 720x1616", b"")),
+    )
+    mock_exec.side_effect = [process, one_shot]
+
+    with (
+        patch("main.PERSISTENT_SHELL", True),
+        patch.dict("main._adb_shells", clear=True),
+    ):
+        result = await get_device_info()
+
+        # Check that the query script was retried as `adb shell <script>`
+        assert mock_exec.call_count == 2
+        assert mock_exec.call_args[0][:2] == ("adb", "shell")
+        assert result["screen_dimensions"] == {"width": 720, "height": 1616}
+
+
+async def test_input_text_persistent_shell_error(mock_exec):
+    """Test that a failing command in the persistent shell raises an error."""
+    mock_exec.return_value = make_shell_process(output=b"Error: no focus\n", status=1)
+
+    with (
+        patch("main.PERSISTENT_SHELL", True),
+        patch.dict("main._adb_shells", clear=True),
+    ):
+        with pytest.raises(RuntimeError, match="ADB input text command failed"):
+            await input_text("hello")
+
+
+async def test_execute_adb_batch(mock_exec):
+    """Test that execute_adb_batch runs all commands through one shell."""
+    process = make_shell_process(output=b"ok\n")
+    mock_exec.return_value = process
+
+    with patch("main.asyncio.sleep", AsyncMock()) as mock_sleep:
+        result = await execute_adb_batch(
+            ["input keyevent KEYCODE_HOME", "sleep 0.5", "input tap 360 800"],
+            validate_after=False,
+        )
+
+        # Check that one shell ran both device commands
+        mock_exec.assert_called_once()
+        assert len(process.stdin.commands) == 2
+        assert process.stdin.commands[1].startswith(b"( eval 'input tap 360 800' )")
+
+        # Check that the sleep step was handled on the host
+        mock_sleep.assert_awaited_once_with(0.5)
+
+        assert "$ input keyevent KEYCODE_HOME\nok" in result
+        assert "$ sleep 0.5" in result
+
+
+async def test_execute_adb_batch_validate_after(mock_exec):
+    """Test that execute_adb_batch appends the view hierarchy when requested."""
+    mock_exec.return_value = make_shell_process()
+
+    with patch(
+        "main.inspect_screen_structure", AsyncMock(return_value="<hierarchy/>")
+    ) as mock_inspect:
+        result = await execute_adb_batch(["input tap 1 2"])
+
+        mock_inspect.assert_awaited_once()
+        assert result.endswith("<hierarchy/>")
+
+
+async def test_execute_adb_batch_error(mock_exec):
+    """Test that execute_adb_batch stops at the first failing command."""
+    process = make_shell_process(output=b"not found\n", status=127)
+    mock_exec.return_value = process
+
+    with pytest.raises(RuntimeError, match="ADB batch command 'bogus' failed"):
+        await execute_adb_batch(["bogus", "input tap 1 2"], validate_after=False)
+
+    assert len(process.stdin.commands) == 1
+
+
+async def test_execute_adb_batch_unbalanced_quote(local_shell):
+    """Test that a malformed batch command fails without wedging the shared session."""
+    with (
+        patch("main.PERSISTENT_SHELL", True),
+        patch.dict("main._adb_shells", clear=True),
+    ):
+        try:
+            with pytest.raises(
+                RuntimeError, match="ADB batch command 'echo 'x' failed"
+            ):
+                await execute_adb_batch(["echo 'x", "echo never"], validate_after=False)
+
+            # Check that the persistent session still runs commands
+            result = await execute_adb_batch(["echo ok"], validate_after=False)
+            assert result == "$ echo ok\nok"
+        finally:
+            await get_adb_shell().close()
+
+
+async def test_execute_adb_batch_timeout(local_shell):
+    """Test that a batch command that never finishes fails instead of hanging."""
+    with patch("main.SHELL_COMMAND_TIMEOUT", 0.2):
+        with pytest.raises(
+            RuntimeError, match="ADB batch command 'sleep 1 && echo done' failed"
+        ):
+            await execute_adb_batch(["sleep 1 && echo done"], validate_after=False)
+
+
+async def test_execute_adb_batch_empty():
+    """Test that execute_adb_batch validates that commands are not empty."""
+    with pytest.raises(ValueError, match="Commands cannot be empty"):
+        await execute_adb_batch([])
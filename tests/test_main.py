@@ -1,85 +1,252 @@
+import asyncio
 import pytest
-from unittest.mock import patch, MagicMock, AsyncMock
+from unittest.mock import patch, AsyncMock
 import base64
+import io
+import struct
+import subprocess
+from types import SimpleNamespace
+import main
 from main import (
     take_android_screenshot,
+    take_android_screenshot_bytes,
+    raw_screencap_to_png,
     describe_visible_elements,
     tap_screen,
     tap_element_fallback,
+    locate_elements_fallback,
+    find_element_in_hierarchy,
+    inspect_screen_structure,
     input_text,
     capture_screenshot,
     get_device_info,
+    run_adb_command,
 )
 
 
-@pytest.mark.asyncio
-async def test_take_android_screenshot():
+@pytest.fixture(autouse=True)
+def clear_screen_caches():
+    """Start every test without a cached screenshot or view hierarchy."""
+    main._forget_screen_state()
+    yield
+    main._forget_screen_state()
+
+
+MOCK_SCREENSHOT = b"mock_screenshot_data"
+MOCK_SCREENSHOT_B64 = base64.b64encode(MOCK_SCREENSHOT).decode()
+
+MOCK_HIERARCHY = (
+    "<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>"
+    '<hierarchy rotation="0">'
+    '<node text="" content-desc="Settings" bounds="[620,50][700,150]" />'
+    '<node text="" resource-id="com.example:id/user_name" bounds="[40,450][680,550]" />'
+    '<node text="Login" content-desc="" bounds="[40,800][680,900]" />'
+    '<node text="Login with Google" bounds="[40,1000][680,1100]" />'
+    '<node text="OK" bounds="[40,1200][340,1300]" />'
+    '<node text="OK" bounds="[380,1200][680,1300]" />'
+    "</hierarchy>\nUI hierchary dumped to: /dev/tty"
+)
+
+
+@pytest.mark.parametrize(
+    "device_id, argv",
+    [
+        pytest.param(None, ("adb", "exec-out", "screencap", "-p"), id="default"),
+        pytest.param(
+            "test_device",
+            ("adb", "-s", "test_device", "exec-out", "screencap", "-p"),
+            id="device_id",
+        ),
+    ],
+)
+async def test_take_android_screenshot(adb_process, device_id, argv):
     """Test that take_android_screenshot calls the ADB command correctly and returns base64 encoded screenshot."""
-    # Mock the asyncio subprocess
-    mock_process = MagicMock()
-    mock_process.returncode = 0
-    mock_process.communicate = AsyncMock(return_value=(b"mock_screenshot_data", b""))
-
-    with patch(
-        "asyncio.create_subprocess_exec", return_value=mock_process
-    ) as mock_exec:
-        # Call the function
-        result = await take_android_screenshot()
-
-        # Check that the correct command was executed
-        mock_exec.assert_called_once()
-        args = mock_exec.call_args[0]
-        assert args[0] == "adb"
-        assert "screencap" in args
-
-        # Check that the result is base64 encoded
-        expected_result = base64.b64encode(b"mock_screenshot_data").decode()
-        assert result == expected_result
-
-
-@pytest.mark.asyncio
-async def test_take_android_screenshot_with_device_id():
-    """Test that take_android_screenshot includes the device ID when provided."""
-    # Mock the asyncio subprocess
-    mock_process = MagicMock()
-    mock_process.returncode = 0
-    mock_process.communicate = AsyncMock(return_value=(b"mock_screenshot_data", b""))
-
-    with patch(
-        "asyncio.create_subprocess_exec", return_value=mock_process
-    ) as mock_exec:
-        # Call the function with a device ID
-        await take_android_screenshot("test_device")
-
-        # Check that the correct command was executed with the device ID
-        mock_exec.assert_called_once()
-        args = mock_exec.call_args[0]
-        assert args[0] == "adb"
-        assert args[1] == "-s"
-        assert args[2] == "test_device"
-
-
-@pytest.mark.asyncio
-async def test_take_android_screenshot_error():
+    process, mock_exec = adb_process
+    process.communicate.return_value = (MOCK_SCREENSHOT, b"")
+
+    # Call the function
+    result = await take_android_screenshot(device_id)
+
+    # Check that the correct command was executed, including the device ID when provided
+    mock_exec.assert_called_once()
+    assert mock_exec.call_args[0] == argv
+
+    # Check that the result is base64 encoded
+    assert result == MOCK_SCREENSHOT_B64
+
+
+async def test_take_android_screenshot_error(adb_process):
     """Test that take_android_screenshot handles errors correctly."""
-    # Mock the asyncio subprocess with error
-    mock_process = MagicMock()
-    mock_process.returncode = 1
-    mock_process.communicate = AsyncMock(return_value=(b"", b"ADB error"))
+    process, _ = adb_process
+    process.returncode = 1
+    process.communicate.return_value = (b"", b"ADB error")
+
+    # Call the function and check that it raises the expected error
+    with pytest.raises(RuntimeError, match="ADB screenshot command failed"):
+        await take_android_screenshot()
+
 
-    with patch("asyncio.create_subprocess_exec", return_value=mock_process):
-        # Call the function and check that it raises the expected error
-        with pytest.raises(RuntimeError, match="ADB screenshot command failed"):
-            await take_android_screenshot()
+async def test_take_android_screenshot_bytes(adb_process):
+    """Test that take_android_screenshot_bytes returns the raw PNG bytes without encoding."""
+    process, _ = adb_process
+    process.communicate.return_value = (MOCK_SCREENSHOT, b"")
+
+    # Call the function
+    result = await take_android_screenshot_bytes()
+
+    # Check that the raw bytes are returned unchanged
+    assert result == MOCK_SCREENSHOT
+
+
+async def test_take_android_screenshot_bytes_concurrent(adb_process):
+    """Test that concurrent screenshot requests share a single adb call."""
+    process, mock_exec = adb_process
+    process.communicate.return_value = (MOCK_SCREENSHOT, b"")
+
+    results = await asyncio.gather(
+        take_android_screenshot_bytes(), take_android_screenshot_bytes()
+    )
+
+    # Check that only one screencap was spawned for both callers
+    mock_exec.assert_called_once()
+    assert results == [MOCK_SCREENSHOT, MOCK_SCREENSHOT]
+
+    # Check that a later request within the TTL reuses the screenshot
+    await take_android_screenshot_bytes()
+    mock_exec.assert_called_once()
+
+    # Check that a fresh request starts a new capture
+    await take_android_screenshot_bytes(fresh=True)
+    assert mock_exec.call_count == 2
+
+
+async def test_take_android_screenshot_bytes_invalidated_by_input(adb_process):
+    """Test that input commands clear the cached screenshot."""
+    process, mock_exec = adb_process
+    process.communicate.return_value = (MOCK_SCREENSHOT, b"")
+
+    await take_android_screenshot_bytes()
+    await tap_screen(100, 200)
+    await take_android_screenshot_bytes()
+
+    # Check that the screenshot after the tap was captured again
+    assert mock_exec.call_count == 3
+
+
+async def test_take_android_screenshot_bytes_inflight_invalidated_by_input(
+    adb_process,
+):
+    """Test that a capture started before an input command is not reused after it."""
+    process, mock_exec = adb_process
+    release = asyncio.Event()
+    outputs = iter([b"before", b"", b"after"])
+
+    async def communicate():
+        output = next(outputs)
+        if output == b"before":
+            await release.wait()
+        return (output, b"")
+
+    process.communicate.side_effect = communicate
+
+    before = asyncio.ensure_future(take_android_screenshot_bytes())
+    while mock_exec.call_count == 0:
+        await asyncio.sleep(0)
+    await tap_screen(100, 200)
+    after = asyncio.ensure_future(take_android_screenshot_bytes())
+    release.set()
+
+    # Check that the request after the tap started its own capture
+    assert await before == b"before"
+    assert await after == b"after"
+    assert mock_exec.call_count == 3
+
+    # Check that the pre-tap capture did not overwrite the cached screenshot
+    assert await take_android_screenshot_bytes() == b"after"
+    assert mock_exec.call_count == 3
+
+
+async def test_take_android_screenshot_bytes_cached_from_capture_start(
+    adb_process, monkeypatch
+):
+    """Test that a joined capture is cached under the time the capture started."""
+    process, mock_exec = adb_process
+    release = asyncio.Event()
+    outputs = iter([b"first", b"second"])
+
+    async def communicate():
+        output = next(outputs)
+        if output == b"first":
+            await release.wait()
+        return (output, b"")
+
+    process.communicate.side_effect = communicate
+    now = 0.0
+    monkeypatch.setattr("main.time", SimpleNamespace(monotonic=lambda: now))
+
+    first = asyncio.ensure_future(take_android_screenshot_bytes())
+    while mock_exec.call_count == 0:
+        await asyncio.sleep(0)
+
+    # A caller joining the capture later must not extend its cache lifetime
+    now = 0.2
+    joined = asyncio.ensure_future(take_android_screenshot_bytes())
+    release.set()
+    assert await first == await joined == b"first"
+
+    now = 0.3
+    assert await take_android_screenshot_bytes() == b"second"
+    assert mock_exec.call_count == 2
+
+
+@pytest.mark.parametrize(
+    "pixel_format, pixels",
+    [
+        pytest.param(1, bytes([255, 0, 0, 255, 0, 0, 255, 255]), id="RGBA_8888"),
+        pytest.param(2, bytes([255, 0, 0, 0, 0, 0, 255, 0]), id="RGBX_8888"),
+        pytest.param(5, bytes([0, 0, 255, 255, 255, 0, 0, 255]), id="BGRA_8888"),
+    ],
+)
+def test_raw_screencap_to_png(pixel_format, pixels):
+    """Test that raw screencap output is decoded and encoded as PNG."""
+    Image = pytest.importorskip("PIL.Image")
+
+    # 2x1 red/blue frame with the 16-byte (Android 9+) header
+    data = struct.pack("<IIII", 2, 1, pixel_format, 0) + pixels
+
+    png = raw_screencap_to_png(data)
+
+    with Image.open(io.BytesIO(png)) as img:
+        assert img.format == "PNG"
+        assert img.size == (2, 1)
+        assert img.convert("RGBA").getpixel((0, 0)) == (255, 0, 0, 255)
+        assert img.convert("RGBA").getpixel((1, 0)) == (0, 0, 255, 255)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        pytest.param(b"\x02\x00", id="short_header"),
+        pytest.param(
+            (2).to_bytes(4, "little") * 2 + (1).to_bytes(4, "little") + bytes(4),
+            id="short_pixels",
+        ),
+    ],
+)
+def test_raw_screencap_to_png_truncated(data):
+    """Test that truncated screencap output raises a clear error."""
+    pytest.importorskip("PIL.Image")
+
+    with pytest.raises(RuntimeError, match="Truncated screencap output"):
+        raw_screencap_to_png(data)
 
 
-@pytest.mark.asyncio
 async def test_describe_visible_elements():
-    """Test that describe_visible_elements calls take_android_screenshot and describe_screen_interactions correctly."""
+    """Test that describe_visible_elements calls take_android_screenshot_bytes and describe_screen_interactions correctly."""
     with (
         patch(
-            "main.take_android_screenshot",
-            return_value=AsyncMock(return_value="mock_screenshot_base64"),
+            "main.take_android_screenshot_bytes",
+            AsyncMock(return_value=MOCK_SCREENSHOT),
         ),
         patch(
             "main.describe_screen_interactions", return_value="Mock screen description"
@@ -93,34 +260,47 @@ async def test_describe_visible_elements():
         assert result == "Mock screen description"
 
 
-@pytest.mark.asyncio
-async def test_tap_screen():
+async def test_tap_screen(adb_process):
     """Test that tap_screen calls the ADB command correctly."""
-    # Mock the asyncio subprocess
-    mock_process = MagicMock()
-    mock_process.returncode = 0
-    mock_process.communicate = AsyncMock(return_value=(b"", b""))
-
-    with patch(
-        "asyncio.create_subprocess_exec", return_value=mock_process
-    ) as mock_exec:
-        # Call the function
-        result = await tap_screen(100, 200)
+    _, mock_exec = adb_process
+
+    # Call the function
+    result = await tap_screen(100, 200)
+
+    # Check that the correct command was executed
+    mock_exec.assert_called_once()
+    args = mock_exec.call_args[0]
+    assert args == ("adb", "shell", "input", "tap", "100", "200")
+
+    # Check that the command's stdout is discarded rather than piped
+    assert mock_exec.call_args[1]["stdout"] == asyncio.subprocess.DEVNULL
+
+    # Check that the result is a confirmation message
+    assert "Tapped at (100, 200)" in result
+
+
+async def test_tap_screen_concurrency_limit(adb_process, monkeypatch):
+    """Test that concurrent adb calls are capped by the adb semaphore."""
+    process, _ = adb_process
+    running = 0
+    max_running = 0
 
-        # Check that the correct command was executed
-        mock_exec.assert_called_once()
-        args = mock_exec.call_args[0]
-        assert args[0] == "adb"
-        assert "input" in args
-        assert "tap" in args
-        assert "100" in args
-        assert "200" in args
+    async def communicate():
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return (b"", b"")
 
-        # Check that the result is a confirmation message
-        assert "Tapped at (100, 200)" in result
+    process.communicate = communicate
+    monkeypatch.setattr("main._adb_semaphore", asyncio.Semaphore(2))
+
+    await asyncio.gather(*(tap_screen(i, i) for i in range(5)))
+
+    assert max_running == 2
 
 
-@pytest.mark.asyncio
 async def test_tap_screen_invalid_coordinates():
     """Test that tap_screen validates coordinates."""
     # Call the function with negative coordinates and check that it raises the expected error
@@ -128,7 +308,26 @@ async def test_tap_screen_invalid_coordinates():
         await tap_screen(-10, 200)
 
 
-@pytest.mark.asyncio
+async def test_inspect_screen_structure(adb_process):
+    """Test that inspect_screen_structure strips the dump trailer and caches the XML."""
+    process, mock_exec = adb_process
+    process.communicate.return_value = (MOCK_HIERARCHY.encode(), b"")
+
+    result = await inspect_screen_structure()
+
+    assert result.endswith("</hierarchy>")
+    assert "dumped to" not in result
+
+    # Check that a repeated call reuses the dump
+    assert await inspect_screen_structure() == result
+    mock_exec.assert_called_once()
+
+    # Check that an input command invalidates the cached dump
+    await tap_screen(100, 200)
+    await inspect_screen_structure()
+    assert mock_exec.call_count == 3
+
+
 async def test_tap_element_fallback():
     """Test that tap_element_fallback calls find_element_coordinates_by_description and tap_screen correctly."""
     mock_element_info = {
@@ -140,14 +339,18 @@ async def test_tap_element_fallback():
 
     with (
         patch(
-            "main.take_android_screenshot",
-            AsyncMock(return_value="mock_screenshot_base64"),
+            "main.take_android_screenshot_bytes",
+            AsyncMock(return_value=MOCK_SCREENSHOT),
         ),
         patch(
             "main.find_element_coordinates_by_description",
             return_value=mock_element_info,
         ),
         patch("main.tap_screen", AsyncMock(return_value="Tapped at (100, 200)")),
+        patch(
+            "main.inspect_screen_structure",
+            AsyncMock(return_value=MOCK_HIERARCHY),
+        ),
     ):
 
         # Call the function
@@ -159,42 +362,155 @@ async def test_tap_element_fallback():
         assert "0.90" in result  # Formatted confidence
 
 
-@pytest.mark.asyncio
-async def test_input_text():
+async def test_tap_element_fallback_uses_hierarchy():
+    """Test that tap_element_fallback skips vision when the hierarchy has a unique match."""
+    with (
+        patch(
+            "main.take_android_screenshot_bytes",
+            AsyncMock(return_value=MOCK_SCREENSHOT),
+        ) as mock_screenshot,
+        patch("main.find_element_coordinates_by_description") as mock_find,
+        patch(
+            "main.tap_screen", AsyncMock(return_value="Tapped at (360, 850)")
+        ) as mock_tap,
+        patch(
+            "main.inspect_screen_structure",
+            AsyncMock(return_value=MOCK_HIERARCHY),
+        ),
+    ):
+        result = await tap_element_fallback("the Login button")
+
+        # Check that neither a screenshot nor the vision model was needed
+        mock_screenshot.assert_not_awaited()
+        mock_find.assert_not_called()
+        mock_tap.assert_awaited_once_with(360, 850)
+        assert "Tapped element 'Login'" in result
+
+
+async def test_locate_elements_fallback():
+    """Test that locate_elements_fallback only sends hierarchy misses to vision, in one call."""
+    vision_results = [
+        {"x": 50, "y": 60, "confidence": 0.8, "element_description": "Avatar"}
+    ]
+    with (
+        patch(
+            "main.take_android_screenshot_bytes",
+            AsyncMock(return_value=MOCK_SCREENSHOT),
+        ),
+        patch(
+            "main.find_multiple_element_coordinates", return_value=vision_results
+        ) as mock_find,
+        patch(
+            "main.inspect_screen_structure",
+            AsyncMock(return_value=MOCK_HIERARCHY),
+        ),
+    ):
+        result = await locate_elements_fallback(
+            ["the Login button", "profile picture", "Settings"]
+        )
+
+        mock_find.assert_called_once_with(MOCK_SCREENSHOT, ["profile picture"])
+        assert [(e["x"], e["y"]) for e in result] == [(360, 850), (50, 60), (660, 100)]
+
+
+async def test_locate_elements_fallback_relational():
+    """Test that relational descriptions are looked up with vision, not the landmark."""
+    vision_results = [
+        {"x": 600, "y": 100, "confidence": 0.8, "element_description": "Gear icon"}
+    ]
+    with (
+        patch(
+            "main.take_android_screenshot_bytes",
+            AsyncMock(return_value=MOCK_SCREENSHOT),
+        ),
+        patch(
+            "main.find_multiple_element_coordinates", return_value=vision_results
+        ) as mock_find,
+        patch(
+            "main.inspect_screen_structure",
+            AsyncMock(return_value=MOCK_HIERARCHY),
+        ),
+    ):
+        result = await locate_elements_fallback(
+            ["the gear icon to the left of Settings"]
+        )
+
+        mock_find.assert_called_once_with(
+            MOCK_SCREENSHOT, ["the gear icon to the left of Settings"]
+        )
+        assert result == vision_results
+
+
+async def test_locate_elements_fallback_empty():
+    """Test that locate_elements_fallback validates that descriptions are not empty."""
+    with pytest.raises(ValueError, match="Descriptions cannot be empty"):
+        await locate_elements_fallback([])
+
+
+def test_find_element_in_hierarchy():
+    """Test matching descriptions against view hierarchy labels."""
+    # Matches on text, content-desc and resource-id, ignoring generic words
+    assert find_element_in_hierarchy(MOCK_HIERARCHY, "Login")["x"] == 360
+    assert find_element_in_hierarchy(MOCK_HIERARCHY, "settings icon")["y"] == 100
+    assert find_element_in_hierarchy(MOCK_HIERARCHY, "the user name field")["y"] == 500
+
+    result = find_element_in_hierarchy(MOCK_HIERARCHY, "Login with Google button")
+    assert (result["x"], result["y"]) == (360, 1050)
+    assert result["confidence"] < 1.0
+
+    # Ambiguous or missing matches fall back to vision
+    assert find_element_in_hierarchy(MOCK_HIERARCHY, "the OK button") is None
+    assert find_element_in_hierarchy(MOCK_HIERARCHY, "red circle") is None
+    assert find_element_in_hierarchy("not xml", "Login") is None
+
+
+@pytest.mark.parametrize(
+    "description",
+    [
+        "the Login button below the user name field",
+        "the gear icon to the left of Settings",
+        "the Login button at the bottom of the screen",
+        "the button next to Login with Google",
+    ],
+)
+def test_find_element_in_hierarchy_relational(description):
+    """Test that descriptions relative to a label do not match that label."""
+    assert find_element_in_hierarchy(MOCK_HIERARCHY, description) is None
+
+
+async def test_input_text(adb_process):
     """Test that input_text calls the ADB command correctly."""
-    # Mock the asyncio subprocess
-    mock_process = MagicMock()
-    mock_process.returncode = 0
-    mock_process.communicate = AsyncMock(return_value=(b"", b""))
-
-    with patch(
-        "asyncio.create_subprocess_exec", return_value=mock_process
-    ) as mock_exec:
-        # Call the function
-        result = await input_text("hello world")
+    _, mock_exec = adb_process
+
+    # Call the function
+    result = await input_text("hello world")
+
+    # Check that the correct command was executed
+    mock_exec.assert_called_once()
+    args = mock_exec.call_args[0]
+    assert args == ("adb", "shell", "input", "text", "hello%sworld")
+
+    # Check that the result is a confirmation message
+    assert "Sent keystrokes 'hello world'" in result
+
+
+async def test_input_text_quotes_shell_characters(adb_process):
+    """Test that input_text quotes text so the device shell does not interpret it."""
+    _, mock_exec = adb_process
 
-        # Check that the correct command was executed
-        mock_exec.assert_called_once()
-        args = mock_exec.call_args[0]
-        assert args[0] == "adb"
-        assert "input" in args
-        assert "text" in args
-        assert "hello world" in args
+    await input_text("a&b; it's")
 
-        # Check that the result is a confirmation message
-        assert "Sent keystrokes 'hello world'" in result
+    assert mock_exec.call_args[0][-1] == "'a&b;%sit'\"'\"'s'"
 
 
 # This test is no longer applicable - the input_text function doesn't support device_id
 # parameter since all tools exposed via MCP should not have device_id field
 @pytest.mark.skip("input_text no longer supports device_id parameter")
-@pytest.mark.asyncio
 async def test_input_text_with_device_id():
     """Test that input_text includes the device ID when provided."""
     pass
 
 
-@pytest.mark.asyncio
 async def test_input_text_empty_text():
     """Test that input_text validates that text is not empty."""
     # Call the function with empty text and check that it raises the expected error
@@ -202,71 +518,58 @@ async def test_input_text_empty_text():
         await input_text("")
 
 
-@pytest.mark.asyncio
-async def test_input_text_error():
+async def test_input_text_error(adb_process):
     """Test that input_text handles errors correctly."""
-    # Mock the asyncio subprocess with error
-    mock_process = MagicMock()
-    mock_process.returncode = 1
-    mock_process.communicate = AsyncMock(return_value=(b"", b"ADB error"))
+    process, _ = adb_process
+    process.returncode = 1
+    process.communicate.return_value = (b"", b"ADB error")
 
-    with patch("asyncio.create_subprocess_exec", return_value=mock_process):
-        # Call the function and check that it raises the expected error
-        with pytest.raises(RuntimeError, match="ADB input text command failed"):
-            await input_text("hello world")
+    # Call the function and check that it raises the expected error
+    with pytest.raises(RuntimeError, match="ADB input text command failed"):
+        await input_text("hello world")
 
 
-@pytest.mark.asyncio
-async def test_capture_screenshot():
+async def test_capture_screenshot(adb_process, monkeypatch):
     """Test that capture_screenshot calls the ADB command correctly and returns an Image object."""
-    # Mock the asyncio subprocess
-    mock_process = MagicMock()
-    mock_process.returncode = 0
-    mock_process.communicate = AsyncMock(return_value=(b"mock_png_data", b""))
+    process, mock_exec = adb_process
+    process.communicate.return_value = (b"mock_png_data", b"")
 
-    # Mock the Image class
-    mock_image = MagicMock()
+    # Stub the Image class, recording how it is constructed
+    image = object()
+    image_calls = []
 
-    with (
-        patch("asyncio.create_subprocess_exec", return_value=mock_process) as mock_exec,
-        patch("main.Image", return_value=mock_image) as mock_image_class,
-    ):
-        # Call the function
-        result = await capture_screenshot()
+    def fake_image(**kwargs):
+        image_calls.append(kwargs)
+        return image
+
+    monkeypatch.setattr("main.Image", fake_image)
 
-        # Check that the correct command was executed
-        mock_exec.assert_called_once()
-        args = mock_exec.call_args[0]
-        assert args[0] == "adb"
-        assert "exec-out" in args
-        assert "screencap" in args
-        assert "-p" in args
+    # Call the function
+    result = await capture_screenshot()
 
-        # Check that Image was constructed with the raw PNG data
-        mock_image_class.assert_called_once_with(data=b"mock_png_data", format="PNG")
+    # Check that the correct command was executed
+    mock_exec.assert_called_once()
+    args = mock_exec.call_args[0]
+    assert args == ("adb", "exec-out", "screencap", "-p")
 
-        # Check that the result is the mock Image object
-        assert result == mock_image
+    # Check that Image was constructed with the raw PNG data
+    assert image_calls == [{"data": b"mock_png_data", "format": "PNG"}]
 
+    # Check that the result is the stub Image object
+    assert result is image
 
-@pytest.mark.asyncio
-async def test_capture_screenshot_error():
+
+async def test_capture_screenshot_error(adb_process):
     """Test that capture_screenshot handles errors correctly."""
-    # Mock the asyncio subprocess with error
-    mock_process = MagicMock()
-    mock_process.returncode = 1
-    mock_process.communicate = AsyncMock(return_value=(b"", b"ADB error"))
+    process, _ = adb_process
+    process.returncode = 1
+    process.communicate.return_value = (b"", b"ADB error")
 
-    with (
-        patch("asyncio.create_subprocess_exec", return_value=mock_process),
-        # We don't need to mock Image here since the exception should be raised before it's used
-    ):
-        # Call the function and check that it raises the expected error
-        with pytest.raises(RuntimeError, match="ADB screenshot command failed"):
-            await capture_screenshot()
+    # Call the function and check that it raises the expected error
+    with pytest.raises(RuntimeError, match="ADB screenshot command failed"):
+        await capture_screenshot()
 
 
-@pytest.mark.asyncio
 async def test_get_device_info():
     """Test that get_device_info returns device properties with the expected structure."""
     # Call the function and check the returned data structure
@@ -297,94 +600,146 @@ async def test_get_device_info():
         assert isinstance(result["memory"], dict)
 
 
-@pytest.mark.asyncio
-async def test_get_device_info_command_failures():
+async def test_get_device_info_mocked(adb_process):
+    """Test that get_device_info parses the output of each device query."""
+    output = "\n__EYEMCP_SECTION__\n".join(
+        [
+            "Physical size: 720x1616",
+            "14",
+            "34",
+            "Pixel 7",
+            "Google",
+            "UQ1A.240205.004",
+            "Current Battery Service state:\n  AC powered: false\n  status: 2\n  level: 85",
+            "MemTotal: 8388608 kB\nMemAvailable: 4194304 kB",
+        ]
+    )
+    process, mock_exec = adb_process
+    process.communicate.return_value = (output.encode(), b"")
+
+    result = await get_device_info()
+
+    # Check that all queries ran in a single adb shell call
+    mock_exec.assert_called_once()
+    assert mock_exec.call_args[0][:2] == ("adb", "shell")
+
+    assert result == {
+        "screen_dimensions": {"width": 720, "height": 1616},
+        "android_version": {"release": "14", "sdk": "34"},
+        "device_model": "Pixel 7",
+        "manufacturer": "Google",
+        "build_id": "UQ1A.240205.004",
+        "battery": {"level": 85, "status": "charging"},
+        "memory": {"total_mb": 8192, "available_mb": 4096},
+    }
+
+
+async def test_get_device_info_command_failures(adb_process):
     """Test that get_device_info handles command failures gracefully."""
-    # Mock the asyncio subprocess with all commands failing
-    mock_process = MagicMock()
-    mock_process.returncode = 1
-    mock_process.communicate = AsyncMock(return_value=(b"", b"Command failed"))
+    process, _ = adb_process
+    process.returncode = 1
+    process.communicate.return_value = (b"", b"Command failed")
 
-    with patch("asyncio.create_subprocess_exec", return_value=mock_process):
-        # Call the function
-        result = await get_device_info()
-
-        # Check that the function returns a dictionary even with failures
-        assert isinstance(result, dict)
-
-        # The dictionary should be mostly empty or contain default values
-        if "screen_dimensions" in result:
-            assert isinstance(result["screen_dimensions"], dict)
-        if "android_version" in result:
-            assert result["android_version"].get("release", "") == ""
-        if "battery" in result:
-            assert isinstance(result["battery"], dict)
-
-
-@pytest.mark.asyncio
-async def test_run_adb_command():
-    """Test that run_adb_command calls the ADB command correctly."""
-    # Mock the asyncio subprocess
-    mock_process = MagicMock()
-    mock_process.returncode = 0
-    mock_process.communicate = AsyncMock(return_value=(b"mock command output", b""))
-
-    with patch(
-        "asyncio.create_subprocess_exec", return_value=mock_process
-    ) as mock_exec:
-        # Call the function
-        from main import run_adb_command
+    # Call the function
+    result = await get_device_info()
+
+    # Check that the function returns a dictionary even with failures
+    assert isinstance(result, dict)
+
+    # The dictionary should be mostly empty or contain default values
+    if "screen_dimensions" in result:
+        assert isinstance(result["screen_dimensions"], dict)
+    if "android_version" in result:
+        assert result["android_version"].get("release", "") == ""
+    if "battery" in result:
+        assert isinstance(result["battery"], dict)
 
-        result = await run_adb_command("devices")
 
-        # Check that the correct command was executed
-        mock_exec.assert_called_once()
-        args = mock_exec.call_args[0]
-        assert args[0] == "adb"
-        assert args[1] == "devices"
+@pytest.mark.parametrize(
+    "command, argv, output",
+    [
+        pytest.param("devices", ("adb", "devices"), "mock command output", id="simple"),
+        pytest.param(
+            "shell pm list packages com.android",
+            ("adb", "shell", "pm list packages com.android"),
+            "package:com.android.example",
+            id="complex",
+        ),
+    ],
+)
+async def test_run_adb_command(adb_process, command, argv, output):
+    """Test that run_adb_command calls the ADB command correctly and returns its output."""
+    process, mock_exec = adb_process
+    process.communicate.return_value = (output.encode(), b"")
 
-        # Check that the result is the command output
-        assert result == "mock command output"
+    # Call the function
+    result = await run_adb_command(command)
 
+    # Check that the correct command was executed
+    mock_exec.assert_called_once()
+    assert mock_exec.call_args[0] == argv
+
+    # Check that the result is the command output
+    assert result == output
 
-@pytest.mark.asyncio
-async def test_run_adb_command_complex():
-    """Test that run_adb_command handles complex commands with multiple arguments correctly."""
-    # Mock the asyncio subprocess
-    mock_process = MagicMock()
-    mock_process.returncode = 0
-    mock_process.communicate = AsyncMock(
-        return_value=(b"package:com.android.example", b"")
-    )
 
-    with patch(
-        "asyncio.create_subprocess_exec", return_value=mock_process
-    ) as mock_exec:
-        # Call the function with a complex command
-        from main import run_adb_command
+@pytest.mark.parametrize(
+    "command, prefix, output",
+    [
+        pytest.param(
+            "shell printf '%s|' 'a b' c", ("adb", "shell"), "a b|c|", id="quotes"
+        ),
+        pytest.param(
+            "shell printf 'level: 85\\n' | grep level",
+            ("adb", "shell"),
+            "level: 85\n",
+            id="pipe",
+        ),
+        pytest.param(
+            "-s emulator-5554 shell echo 'a  b' && echo c",
+            ("adb", "-s", "emulator-5554", "shell"),
+            "a  b\nc\n",
+            id="serial",
+        ),
+    ],
+)
+async def test_run_adb_command_shell_syntax(adb_process, command, prefix, output):
+    """Test that run_adb_command leaves the shell command for the device shell to parse."""
+    _, mock_exec = adb_process
 
-        result = await run_adb_command("shell pm list packages com.android")
+    await run_adb_command(command)
 
-        # Check that the correct command was executed
-        mock_exec.assert_called_once()
-        args = mock_exec.call_args[0]
-        assert args[0] == "adb"
-        assert args[1] == "shell"
-        assert args[2] == "pm"
-        assert args[3] == "list"
-        assert args[4] == "packages"
-        assert args[5] == "com.android"
+    # Check that the shell command is passed on as one argument, which the
+    # device shell parses exactly once
+    argv = mock_exec.call_args[0]
+    assert argv[:-1] == prefix
+    result = subprocess.run(["sh", "-c", argv[-1]], capture_output=True, text=True)
+    assert result.stdout == output
 
-        # Check that the result is the command output
-        assert result == "package:com.android.example"
+
+async def test_run_adb_command_not_limited_by_semaphore(adb_process, monkeypatch):
+    """Test that run_adb_command does not wait for a slot of the adb semaphore."""
+    process, _ = adb_process
+    process.communicate.return_value = (b"output", b"")
+    semaphore = asyncio.Semaphore(1)
+    monkeypatch.setattr("main._adb_semaphore", semaphore)
+
+    # Check that the command runs while every slot is held
+    async with semaphore:
+        result = await asyncio.wait_for(run_adb_command("devices"), timeout=1)
+
+    assert result == "output"
+
+
+async def test_run_adb_command_adb_prefix():
+    """Test that run_adb_command rejects commands that repeat the adb prefix."""
+    with pytest.raises(ValueError, match="should not include the 'adb' prefix"):
+        await run_adb_command("adb devices")
 
 
-@pytest.mark.asyncio
 async def test_run_adb_command_empty():
     """Test that run_adb_command validates that command is not empty."""
     # Call the function with empty command and check that it raises the expected error
-    from main import run_adb_command
-
     with pytest.raises(ValueError, match="Command cannot be empty"):
         await run_adb_command("")
 
@@ -392,17 +747,12 @@ async def test_run_adb_command_empty():
         await run_adb_command("   ")
 
 
-@pytest.mark.asyncio
-async def test_run_adb_command_error():
+async def test_run_adb_command_error(adb_process):
     """Test that run_adb_command handles errors correctly."""
-    # Mock the asyncio subprocess with error
-    mock_process = MagicMock()
-    mock_process.returncode = 1
-    mock_process.communicate = AsyncMock(return_value=(b"", b"ADB error message"))
-
-    with patch("asyncio.create_subprocess_exec", return_value=mock_process):
-        # Call the function and check that it raises the expected error
-        from main import run_adb_command
+    process, _ = adb_process
+    process.returncode = 1
+    process.communicate.return_value = (b"", b"ADB error message")
 
-        with pytest.raises(RuntimeError, match="ADB command failed"):
-            await run_adb_command("some-invalid-command")
+    # Call the function and check that it raises the expected error
+    with pytest.raises(RuntimeError, match="ADB command failed"):
+        await run_adb_command("some-invalid-command")
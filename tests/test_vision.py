@@ -1,67 +1,69 @@
 import pytest
+from types import SimpleNamespace
 from unittest.mock import patch, MagicMock
+import base64
+import io
 import json
+import vision
 from vision import (
     describe_screen_interactions,
     find_element_coordinates_by_description,
+    find_multiple_element_coordinates,
     run_prompt_against_screen,
+    LOOKUP_MAX_TOKENS,
+    REQUEST_TIMEOUT,
 )
 
 
-@pytest.fixture
-def mock_openai_client():
-    """Create a mock OpenAI client for testing."""
-    mock_client = MagicMock()
-    mock_completion = MagicMock()
-    mock_choice = MagicMock()
-    mock_message = MagicMock()
+@pytest.fixture(autouse=True)
+def clear_vision_caches():
+    """Start every test with empty vision result and client caches."""
+    vision._result_cache.clear()
+    vision._clients.clear()
+    yield
+    vision._result_cache.clear()
+    vision._clients.clear()
 
-    # Set up the mock response structure
-    mock_message.content = "Mock response content"
-    mock_choice.message = mock_message
-    mock_completion.choices = [mock_choice]
-    mock_client.chat.completions.create.return_value = mock_completion
 
+def mock_client_returning(content: str) -> MagicMock:
+    """Create a mock OpenAI client whose chat completions return ``content``."""
+    # Only `create` needs to be a mock (tests check its calls); the response
+    # is a plain namespace with the same shape as a chat completion
+    mock_client = MagicMock()
+    mock_client.chat.completions.create.return_value = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))]
+    )
     return mock_client
 
 
+@pytest.fixture
+def mock_openai_client():
+    """Create a mock OpenAI client for testing."""
+    return mock_client_returning("Mock response content")
+
+
 @pytest.fixture
 def mock_openai_json_client():
     """Create a mock OpenAI client that returns JSON responses."""
-    mock_client = MagicMock()
-    mock_completion = MagicMock()
-    mock_choice = MagicMock()
-    mock_message = MagicMock()
-
-    # Set up the mock response structure with JSON content
-    mock_message.content = json.dumps(
-        {"x": 100, "y": 200, "confidence": 0.9, "element_description": "Mock element"}
+    return mock_client_returning(
+        json.dumps(
+            {
+                "x": 100,
+                "y": 200,
+                "confidence": 0.9,
+                "element_description": "Mock element",
+            }
+        )
     )
-    mock_choice.message = mock_message
-    mock_completion.choices = [mock_choice]
-    mock_client.chat.completions.create.return_value = mock_completion
-
-    return mock_client
 
 
 @pytest.fixture
 def mock_openai_text_client():
     """Create a mock OpenAI client that returns text responses with coordinates."""
-    mock_client = MagicMock()
-    mock_completion = MagicMock()
-    mock_choice = MagicMock()
-    mock_message = MagicMock()
-
-    # Set up the mock response structure with text content containing coordinates
-    mock_message.content = """
+    return mock_client_returning("""
     I found the element you described. It appears to be a button in the middle of the screen.
     The coordinates are x: 150 and y: 250. My confidence level is 0.85 that this is the correct element.
-    """
-    mock_choice.message = mock_message
-    mock_completion.choices = [mock_choice]
-    mock_client.chat.completions.create.return_value = mock_completion
-
-    return mock_client
+    """)
 
 
 def test_describe_screen_interactions(mock_openai_client):
@@ -82,6 +84,9 @@ def test_describe_screen_interactions(mock_openai_client):
         # Check that the model is set correctly
         assert kwargs["model"] is not None
 
+        # Check that the request is bounded by a timeout
+        assert kwargs["timeout"] == REQUEST_TIMEOUT
+
         # Check that the messages contain the screenshot
         messages = kwargs["messages"]
         assert any(
@@ -131,6 +136,10 @@ def test_find_element_coordinates_by_description(mock_openai_json_client):
         # Check that the model is set correctly
         assert kwargs["model"] is not None
 
+        # Check that the reply length is capped and sampling is deterministic
+        assert kwargs["max_tokens"] == LOOKUP_MAX_TOKENS
+        assert kwargs["temperature"] == 0
+
         # Check that the messages contain the screenshot and description
         messages = kwargs["messages"]
         user_message = [m for m in messages if m["role"] == "user"][0]
@@ -179,16 +188,8 @@ def test_find_element_coordinates_from_text(mock_openai_text_client):
 
 def test_find_element_coordinates_error_response():
     """Test that find_element_coordinates_by_description handles error responses correctly."""
-    mock_client = MagicMock()
-    mock_completion = MagicMock()
-    mock_choice = MagicMock()
-    mock_message = MagicMock()
-
     # Set up the mock response structure with an error
-    mock_message.content = json.dumps({"error": "Element not found"})
-    mock_choice.message = mock_message
-    mock_completion.choices = [mock_choice]
-    mock_client.chat.completions.create.return_value = mock_completion
+    mock_client = mock_client_returning(json.dumps({"error": "Element not found"}))
 
     with (
         patch("vision.OpenAI", return_value=mock_client),
@@ -205,16 +206,10 @@ def test_find_element_coordinates_error_response():
 
 def test_find_element_coordinates_text_error_response():
     """Test that find_element_coordinates_by_description handles text error responses correctly."""
-    mock_client = MagicMock()
-    mock_completion = MagicMock()
-    mock_choice = MagicMock()
-    mock_message = MagicMock()
-
     # Set up the mock response structure with a text error
-    mock_message.content = "I'm sorry, but I couldn't find any element matching that description. Element not found."
-    mock_choice.message = mock_message
-    mock_completion.choices = [mock_choice]
-    mock_client.chat.completions.create.return_value = mock_completion
+    mock_client = mock_client_returning(
+        "I'm sorry, but I couldn't find any element matching that description. Element not found."
+    )
 
     with (
         patch("vision.OpenAI", return_value=mock_client),
@@ -231,16 +226,10 @@ def test_find_element_coordinates_text_error_response():
 
 def test_find_element_coordinates_missing_coordinates():
     """Test that find_element_coordinates_by_description handles responses with missing coordinates."""
-    mock_client = MagicMock()
-    mock_completion = MagicMock()
-    mock_choice = MagicMock()
-    mock_message = MagicMock()
-
     # Set up the mock response structure with missing coordinates
-    mock_message.content = "I found the button you're looking for. It's a blue button in the center of the screen."
-    mock_choice.message = mock_message
-    mock_completion.choices = [mock_choice]
-    mock_client.chat.completions.create.return_value = mock_completion
+    mock_client = mock_client_returning(
+        "I found the button you're looking for. It's a blue button in the center of the screen."
+    )
 
     with (
         patch("vision.OpenAI", return_value=mock_client),
@@ -255,18 +244,9 @@ def test_find_element_coordinates_missing_coordinates():
 
 def test_find_element_coordinates_invalid_response():
     """Test that find_element_coordinates_by_description handles invalid responses correctly."""
-    mock_client = MagicMock()
-    mock_completion = MagicMock()
-    mock_choice = MagicMock()
-    mock_message = MagicMock()
-
     # Set up the mock response structure with an invalid response (missing required fields)
-    mock_message.content = json.dumps(
-        {"x": 100, "y": 200}
-    )  # Missing confidence and element_description
-    mock_choice.message = mock_message
-    mock_completion.choices = [mock_choice]
-    mock_client.chat.completions.create.return_value = mock_completion
+    # (missing confidence and element_description)
+    mock_client = mock_client_returning(json.dumps({"x": 100, "y": 200}))
 
     with (
         patch("vision.OpenAI", return_value=mock_client),
@@ -335,3 +315,182 @@ def test_find_element_coordinates_api_error():
         # Call the function and check that it raises the expected error
         with pytest.raises(ValueError, match="Failed to find element"):
             find_element_coordinates_by_description("mock_screenshot_base64", "button")
+
+
+def test_describe_screen_interactions_cached(mock_openai_client):
+    """Test that repeated descriptions of the same screenshot reuse the cached result."""
+    with (
+        patch("vision.OpenAI", return_value=mock_openai_client),
+        patch("vision.PROVIDER", "openrouter"),
+        patch("vision.OPENROUTER_API_KEY", "test_key"),
+    ):
+        first = describe_screen_interactions("mock_screenshot_base64")
+        second = describe_screen_interactions("mock_screenshot_base64")
+
+        # Check that the model was only called once
+        mock_openai_client.chat.completions.create.assert_called_once()
+        assert first == second == "Mock response content"
+
+        # A different screenshot is a cache miss
+        describe_screen_interactions("other_screenshot_base64")
+        assert mock_openai_client.chat.completions.create.call_count == 2
+
+
+def test_find_element_coordinates_cached_per_description(mock_openai_json_client):
+    """Test that element lookups are cached per screenshot and description."""
+    with (
+        patch("vision.OpenAI", return_value=mock_openai_json_client),
+        patch("vision.PROVIDER", "openrouter"),
+        patch("vision.OPENROUTER_API_KEY", "test_key"),
+    ):
+        first = find_element_coordinates_by_description(
+            "mock_screenshot_base64", "button"
+        )
+        first["x"] = 0  # Mutating a result must not affect the cache
+        second = find_element_coordinates_by_description(
+            "mock_screenshot_base64", "button"
+        )
+        find_element_coordinates_by_description("mock_screenshot_base64", "icon")
+
+        assert mock_openai_json_client.chat.completions.create.call_count == 2
+        assert second["x"] == 100
+
+
+def test_find_multiple_element_coordinates():
+    """Test that several elements are found with one request and cached individually."""
+    mock_client = mock_client_returning(
+        "```json\n"
+        + json.dumps(
+            [
+                {"x": 100, "y": 200, "confidence": 0.9, "element_description": "Login"},
+                {"error": "Element not found"},
+            ]
+        )
+        + "\n```"
+    )
+
+    with (
+        patch("vision.OpenAI", return_value=mock_client),
+        patch("vision.PROVIDER", "openrouter"),
+        patch("vision.OPENROUTER_API_KEY", "test_key"),
+    ):
+        result = find_multiple_element_coordinates(
+            "mock_screenshot_base64", ["login button", "logout button"]
+        )
+
+        # Check that both descriptions went out in a single request
+        mock_client.chat.completions.create.assert_called_once()
+        kwargs = mock_client.chat.completions.create.call_args[1]
+        text = kwargs["messages"][1]["content"][0]["text"]
+        assert "1. login button\n2. logout button" in text
+
+        assert result == [
+            {"x": 100, "y": 200, "confidence": 0.9, "element_description": "Login"},
+            {"element_description": "logout button", "error": "Element not found"},
+        ]
+
+        # Check that a found element is reused by a later single lookup
+        single = find_element_coordinates_by_description(
+            "mock_screenshot_base64", "login button"
+        )
+        assert single["x"] == 100
+        mock_client.chat.completions.create.assert_called_once()
+
+
+def test_find_multiple_element_coordinates_wrong_length():
+    """Test that a response with the wrong number of results is rejected."""
+    mock_client = mock_client_returning(
+        json.dumps([{"x": 100, "y": 200, "confidence": 0.9}])
+    )
+
+    with (
+        patch("vision.OpenAI", return_value=mock_client),
+        patch("vision.PROVIDER", "openrouter"),
+        patch("vision.OPENROUTER_API_KEY", "test_key"),
+    ):
+        with pytest.raises(ValueError, match="expected a list of 2 results"):
+            find_multiple_element_coordinates(
+                "mock_screenshot_base64", ["login button", "logout button"]
+            )
+
+
+def test_describe_screen_interactions_accepts_bytes(mock_openai_client):
+    """Test that raw PNG bytes are base64-encoded into the image data URL."""
+    with (
+        patch("vision.OpenAI", return_value=mock_openai_client),
+        patch("vision.PROVIDER", "openrouter"),
+        patch("vision.OPENROUTER_API_KEY", "test_key"),
+    ):
+        describe_screen_interactions(b"raw_png")
+
+        args, kwargs = mock_openai_client.chat.completions.create.call_args
+        user_message = [m for m in kwargs["messages"] if m["role"] == "user"][0]
+        assert (
+            user_message["content"][1]["image_url"]["url"]
+            == "data:image/png;base64,cmF3X3BuZw=="
+        )
+
+
+def test_describe_screen_interactions_sends_compressed_jpeg(mock_openai_client):
+    """Test that large screenshots are downscaled and sent as JPEG when Pillow is available."""
+    PIL_Image = pytest.importorskip("PIL.Image")
+
+    png = io.BytesIO()
+    PIL_Image.new("RGB", (720, 3200), "white").save(png, "PNG")
+
+    with (
+        patch("vision.OpenAI", return_value=mock_openai_client),
+        patch("vision.PROVIDER", "openrouter"),
+        patch("vision.OPENROUTER_API_KEY", "test_key"),
+    ):
+        describe_screen_interactions(png.getvalue())
+
+        args, kwargs = mock_openai_client.chat.completions.create.call_args
+        user_message = [m for m in kwargs["messages"] if m["role"] == "user"][0]
+        url = user_message["content"][1]["image_url"]["url"]
+        assert url.startswith("data:image/jpeg;base64,")
+
+        sent = PIL_Image.open(io.BytesIO(base64.b64decode(url.split(",", 1)[1])))
+        assert max(sent.size) == vision.MAX_IMAGE_SIDE
+
+
+def test_run_prompt_against_screen_sends_webp(mock_openai_client):
+    """Test that screenshots are sent as WebP when that format is configured."""
+    PIL_Image = pytest.importorskip("PIL.Image")
+    if not pytest.importorskip("PIL.features").check("webp"):
+        pytest.skip("Pillow was built without WebP support")
+
+    png = io.BytesIO()
+    PIL_Image.new("RGB", (720, 1616), "white").save(png, "PNG")
+
+    with (
+        patch("vision.OpenAI", return_value=mock_openai_client),
+        patch("vision.PROVIDER", "openrouter"),
+        patch("vision.OPENROUTER_API_KEY", "test_key"),
+        patch("vision.COMPRESSED_IMAGE_FORMAT", "WEBP"),
+    ):
+        run_prompt_against_screen(png.getvalue(), "What is shown?")
+
+        args, kwargs = mock_openai_client.chat.completions.create.call_args
+        user_message = [m for m in kwargs["messages"] if m["role"] == "user"][0]
+        url = user_message["content"][1]["image_url"]["url"]
+        assert url.startswith("data:image/webp;base64,")
+
+        sent = PIL_Image.open(io.BytesIO(base64.b64decode(url.split(",", 1)[1])))
+        assert sent.format == "WEBP"
+
+
+def test_vision_client_reused(mock_openai_client):
+    """Test that consecutive vision calls share one OpenAI client."""
+    with (
+        patch("vision.OpenAI", return_value=mock_openai_client) as mock_openai,
+        patch("vision.PROVIDER", "openrouter"),
+        patch("vision.OPENROUTER_API_KEY", "test_key"),
+    ):
+        describe_screen_interactions("screenshot_one")
+        run_prompt_against_screen("screenshot_two", "What is shown?")
+
+        mock_openai.assert_called_once()
+        # Check that the client keeps the SDK's default retries for rate limits
+        assert "max_retries" not in mock_openai.call_args[1]
+        assert mock_openai_client.chat.completions.create.call_count == 2
@@ -1,9 +1,27 @@
+from collections import OrderedDict
 from typing import Any, Dict
+import hashlib
+import io
+import json
 import os
+import re
+import threading
 from loguru import logger
 from openai import OpenAI
 from dotenv import load_dotenv
 
+# Prefer pybase64's SIMD encoder for screenshots when it is installed
+try:
+    from pybase64 import b64decode, b64encode
+except ImportError:
+    from base64 import b64decode, b64encode
+
+# Pillow is optional; without it screenshots are sent as the original PNG
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -24,11 +42,148 @@ OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY", "")
 # Choose your model - examples: "anthropic/claude-3-opus", "openai/gpt-4-vision", etc.
 OPENROUTER_MODEL = "anthropic/claude-sonnet-4"
 
+# Upper bound (in seconds) for each attempt of a vision request, so a hung
+# connection cannot stall a tool call indefinitely. The client keeps its default
+# of two retries with backoff (which also covers rate limits), so a call takes
+# at most about three times this long.
+REQUEST_TIMEOUT = 60.0
+
+# Output token cap per element lookup. A reply only needs the coordinates, a
+# confidence and a short description, so this bounds generation time for
+# verbose models without cutting a normal answer short.
+LOOKUP_MAX_TOKENS = 300
+
+# Screenshots sent for description/analysis are re-encoded in a lossy format
+# (when Pillow is installed) and downscaled to fit this long side, which is
+# about the largest image vision models accept without resizing it themselves.
+# Element lookups keep the original PNG since the model reports coordinates in
+# its pixels.
+MAX_IMAGE_SIDE = 1568
+# "JPEG" or "WEBP". WebP is smaller at similar quality but slower to encode,
+# and needs a Pillow build with WebP support and a model that accepts it.
+COMPRESSED_IMAGE_FORMAT = "JPEG"
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+# Number of vision results kept in memory. Agents often describe, query and
+# locate elements on the same unchanged screen, so identical requests are
+# answered from this cache instead of calling the model again.
+RESULT_CACHE_SIZE = 32
+
+# Patterns for pulling coordinates out of a free-text element lookup reply
+X_COORD_PATTERN = re.compile(r"x\s*[=:]\s*(\d+)", re.IGNORECASE)
+Y_COORD_PATTERN = re.compile(r"y\s*[=:]\s*(\d+)", re.IGNORECASE)
+CONFIDENCE_PATTERN = re.compile(
+    r"confidence\s*(?:[=:]|level\s+is)\s*(0\.\d+|1\.0|1)", re.IGNORECASE
+)
+
 # Use stderr for logging in MCP server
 # No need to add a logger sink as the default stderr sink is already configured in main.py
 
+# LRU cache of vision results keyed by (function, screenshot digest, query).
+# Vision calls run in worker threads, so access is guarded by a lock.
+_result_cache: OrderedDict[tuple, Any] = OrderedDict()
+_result_cache_lock = threading.Lock()
+
+# OpenAI clients per (base URL, API key). Reusing a client keeps its HTTP
+# connection pool, so later vision calls skip the TCP/TLS handshake.
+_clients: dict[tuple[str, str], OpenAI] = {}
+_clients_lock = threading.Lock()
+
+
+def _get_client() -> tuple[OpenAI, str]:
+    """Return the (shared) OpenAI client and model name for the configured provider.
+
+    Raises:
+        ValueError: If the provider is unknown or its API key is missing.
+    """
+    logger.opt(lazy=True).debug("Using provider: {}", lambda: PROVIDER)
+
+    if PROVIDER == "local":
+        base_url, api_key, model = LOCAL_BASE_URL, LOCAL_API_KEY, LOCAL_MODEL
+    elif PROVIDER == "openrouter":
+        if not OPENROUTER_API_KEY:
+            raise ValueError(
+                "OPENROUTER_API_KEY not found in .env file. Please create a .env file with your API key."
+            )
+        base_url, api_key, model = (
+            OPENROUTER_BASE_URL,
+            OPENROUTER_API_KEY,
+            OPENROUTER_MODEL,
+        )
+    else:
+        raise ValueError(f"Unknown provider: {PROVIDER}")
+
+    with _clients_lock:
+        client = _clients.get((base_url, api_key))
+        if client is None:
+            logger.info(f"Connecting to {PROVIDER} model: {model}")
+            client = OpenAI(base_url=base_url, api_key=api_key)
+            _clients[(base_url, api_key)] = client
+    return client, model
+
+
+def _image_data_url(screenshot: bytes | str) -> str:
+    """Build the PNG data URL for a screenshot given as raw bytes or base64."""
+    if isinstance(screenshot, bytes):
+        screenshot = b64encode(screenshot).decode()
+    return f"data:image/png;base64,{screenshot}"
+
+
+def _compressed_image_data_url(screenshot: bytes | str) -> str:
+    """Build a data URL for a smaller JPEG or WebP copy of the screenshot.
+
+    Falls back to the original PNG if Pillow is not installed or the
+    screenshot cannot be decoded or encoded.
+    """
+    if Image is None:
+        return _image_data_url(screenshot)
 
-def describe_screen_interactions(screenshot_b64: str) -> str:
+    try:
+        png = screenshot if isinstance(screenshot, bytes) else b64decode(screenshot)
+        with Image.open(io.BytesIO(png)) as img:
+            img = img.convert("RGB")
+            img.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.LANCZOS)
+            compressed = io.BytesIO()
+            if COMPRESSED_IMAGE_FORMAT == "WEBP":
+                img.save(compressed, "WEBP", quality=WEBP_QUALITY, method=4)
+            else:
+                img.save(compressed, "JPEG", quality=JPEG_QUALITY)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Could not re-encode screenshot, sending PNG: {e}")
+        return _image_data_url(screenshot)
+
+    mime_type = "image/webp" if COMPRESSED_IMAGE_FORMAT == "WEBP" else "image/jpeg"
+    return f"data:{mime_type};base64,{b64encode(compressed.getvalue()).decode()}"
+
+
+def _cache_key(kind: str, screenshot: bytes | str, *query: str) -> tuple:
+    """Build a result-cache key from the screenshot content and the query."""
+    if isinstance(screenshot, str):
+        screenshot = screenshot.encode()
+    digest = hashlib.blake2b(screenshot, digest_size=16).digest()
+    return (kind, digest, *query)
+
+
+def _cache_get(key: tuple) -> Any:
+    """Return the cached result for a key, or None on a miss."""
+    with _result_cache_lock:
+        if key not in _result_cache:
+            return None
+        _result_cache.move_to_end(key)
+        return _result_cache[key]
+
+
+def _cache_put(key: tuple, value: Any) -> None:
+    """Store a result, evicting the least recently used entry when full."""
+    with _result_cache_lock:
+        _result_cache[key] = value
+        _result_cache.move_to_end(key)
+        if len(_result_cache) > RESULT_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+
+
+def describe_screen_interactions(screenshot: bytes | str) -> str:
     """Analyze a screenshot and describe all interactive elements on the screen.
 
     This function uses vision AI to identify all interactive elements on the screen
@@ -37,12 +192,18 @@ def describe_screen_interactions(screenshot_b64: str) -> str:
     the find_element_by_description function.
 
     Args:
-        screenshot_b64: Base64-encoded screenshot image (PNG format).
+        screenshot: Screenshot image (PNG format), as raw bytes or base64-encoded.
 
     Returns:
         A string containing detailed descriptions of all interactive elements on the screen.
     """
-    data_url = f"data:image/png;base64,{screenshot_b64}"
+    cache_key = _cache_key("describe", screenshot)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        logger.info("Returning cached screen description")
+        return cached
+
+    data_url = _compressed_image_data_url(screenshot)
 
     messages: list[dict[str, Any]] = [
         {
@@ -65,40 +226,23 @@ def describe_screen_interactions(screenshot_b64: str) -> str:
     ]
     description = ""
     try:
-        logger.info(f"Using provider: {PROVIDER}")
-
-        if PROVIDER == "local":
-            # Use local provider
-            logger.info(f"Connecting to local model: {LOCAL_MODEL}")
-            client = OpenAI(base_url=LOCAL_BASE_URL, api_key=LOCAL_API_KEY)
-            model = LOCAL_MODEL
-        elif PROVIDER == "openrouter":
-            # Use OpenRouter
-            if not OPENROUTER_API_KEY:
-                raise ValueError(
-                    "OPENROUTER_API_KEY not found in .env file. Please create a .env file with your API key."
-                )
-
-            logger.info(f"Connecting to OpenRouter model: {OPENROUTER_MODEL}")
-            client = OpenAI(base_url=OPENROUTER_BASE_URL, api_key=OPENROUTER_API_KEY)
-            model = OPENROUTER_MODEL
-        else:
-            raise ValueError(f"Unknown provider: {PROVIDER}")
-
-        logger.info("Client created")
+        client, model = _get_client()
         response = client.chat.completions.create(
             model=model,
             messages=messages,
+            timeout=REQUEST_TIMEOUT,
         )
-        logger.info("Response received")
+        logger.debug("Response received")
         description = response.choices[0].message.content
+        if description.strip():
+            _cache_put(cache_key, description.strip())
     except Exception as e:
         logger.error(f"Error: {e}")
 
     return description.strip()
 
 
-def run_prompt_against_screen(screenshot_b64: str, prompt: str) -> str:
+def run_prompt_against_screen(screenshot: bytes | str, prompt: str) -> str:
     """Analyze specific visual details in a screenshot based on a prompt.
 
     This function uses vision AI to analyze specific visual aspects of the screen
@@ -106,14 +250,20 @@ def run_prompt_against_screen(screenshot_b64: str, prompt: str) -> str:
     UI elements' appearance, such as colors, shapes, styles, etc.
 
     Args:
-        screenshot_b64: Base64-encoded screenshot image (PNG format).
+        screenshot: Screenshot image (PNG format), as raw bytes or base64-encoded.
         prompt: Specific question or instruction about visual details to analyze.
             Examples: "What color is the login button?", "Are the corners of the dialog rounded?"
 
     Returns:
         A string containing the detailed analysis of the requested visual aspects.
     """
-    data_url = f"data:image/png;base64,{screenshot_b64}"
+    cache_key = _cache_key("prompt", screenshot, prompt)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        logger.info("Returning cached screen analysis")
+        return cached
+
+    data_url = _compressed_image_data_url(screenshot)
 
     messages: list[dict[str, Any]] = [
         {
@@ -136,33 +286,16 @@ def run_prompt_against_screen(screenshot_b64: str, prompt: str) -> str:
     ]
     analysis = ""
     try:
-        logger.info(f"Using provider: {PROVIDER}")
-
-        if PROVIDER == "local":
-            # Use local provider
-            logger.info(f"Connecting to local model: {LOCAL_MODEL}")
-            client = OpenAI(base_url=LOCAL_BASE_URL, api_key=LOCAL_API_KEY)
-            model = LOCAL_MODEL
-        elif PROVIDER == "openrouter":
-            # Use OpenRouter
-            if not OPENROUTER_API_KEY:
-                raise ValueError(
-                    "OPENROUTER_API_KEY not found in .env file. Please create a .env file with your API key."
-                )
-
-            logger.info(f"Connecting to OpenRouter model: {OPENROUTER_MODEL}")
-            client = OpenAI(base_url=OPENROUTER_BASE_URL, api_key=OPENROUTER_API_KEY)
-            model = OPENROUTER_MODEL
-        else:
-            raise ValueError(f"Unknown provider: {PROVIDER}")
-
-        logger.info("Client created")
+        client, model = _get_client()
         response = client.chat.completions.create(
             model=model,
             messages=messages,
+            timeout=REQUEST_TIMEOUT,
         )
-        logger.info("Response received")
+        logger.debug("Response received")
         analysis = response.choices[0].message.content
+        if analysis.strip():
+            _cache_put(cache_key, analysis.strip())
     except Exception as e:
         logger.error(f"Error analyzing screen detail: {e}")
         analysis = f"Error analyzing screen detail: {str(e)}"
@@ -171,7 +304,7 @@ def run_prompt_against_screen(screenshot_b64: str, prompt: str) -> str:
 
 
 def find_element_coordinates_by_description(
-    screenshot_b64: str, element_description: str
+    screenshot: bytes | str, element_description: str
 ) -> Dict[str, Any]:
     """Find an element on the screen matching the provided description and return its coordinates.
 
@@ -179,7 +312,7 @@ def find_element_coordinates_by_description(
     that best matches the textual description provided.
 
     Args:
-        screenshot_b64: Base64-encoded screenshot image (PNG format).
+        screenshot: Screenshot image (PNG format), as raw bytes or base64-encoded.
         element_description: Textual description of the element to find (e.g., "login button",
                            "search icon in the top right", "profile picture").
 
@@ -191,10 +324,13 @@ def find_element_coordinates_by_description(
     Raises:
         ValueError: If no matching element is found or if the description is ambiguous.
     """
-    import re
-    import json
+    cache_key = _cache_key("find", screenshot, element_description)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        logger.info("Returning cached element coordinates")
+        return dict(cached)
 
-    data_url = f"data:image/png;base64,{screenshot_b64}"
+    data_url = _image_data_url(screenshot)
 
     messages: list[dict[str, Any]] = [
         {
@@ -217,35 +353,18 @@ def find_element_coordinates_by_description(
     ]
 
     try:
-        logger.info(f"Using provider: {PROVIDER}")
-
-        if PROVIDER == "local":
-            # Use local provider
-            logger.info(f"Connecting to local model: {LOCAL_MODEL}")
-            client = OpenAI(base_url=LOCAL_BASE_URL, api_key=LOCAL_API_KEY)
-            model = LOCAL_MODEL
-        elif PROVIDER == "openrouter":
-            # Use OpenRouter
-            if not OPENROUTER_API_KEY:
-                raise ValueError(
-                    "OPENROUTER_API_KEY not found in .env file. Please create a .env file with your API key."
-                )
-
-            logger.info(f"Connecting to OpenRouter model: {OPENROUTER_MODEL}")
-            client = OpenAI(base_url=OPENROUTER_BASE_URL, api_key=OPENROUTER_API_KEY)
-            model = OPENROUTER_MODEL
-        else:
-            raise ValueError(f"Unknown provider: {PROVIDER}")
-
-        logger.info("Client created")
+        client, model = _get_client()
         response = client.chat.completions.create(
             model=model,
             messages=messages,
+            timeout=REQUEST_TIMEOUT,
+            max_tokens=LOOKUP_MAX_TOKENS,
+            temperature=0,
         )
-        logger.info("Response received")
+        logger.debug("Response received")
 
         content = response.choices[0].message.content
-        logger.info(f"Raw response: {content}")
+        logger.opt(lazy=True).debug("Raw response: {}", lambda: content)
 
         # First try to parse as JSON in case the model returns JSON anyway
         try:
@@ -270,21 +389,17 @@ def find_element_coordinates_by_description(
                 raise ValueError("Ambiguous description")
 
             # Extract x coordinate
-            x_match = re.search(r"x\s*[=:]\s*(\d+)", content, re.IGNORECASE)
+            x_match = X_COORD_PATTERN.search(content)
             if not x_match:
                 raise ValueError("Could not find x coordinate in response")
 
             # Extract y coordinate
-            y_match = re.search(r"y\s*[=:]\s*(\d+)", content, re.IGNORECASE)
+            y_match = Y_COORD_PATTERN.search(content)
             if not y_match:
                 raise ValueError("Could not find y coordinate in response")
 
             # Extract confidence if available, default to 0.8 if not found
-            confidence_match = re.search(
-                r"confidence\s*(?:[=:]|level\s+is)\s*(0\.\d+|1\.0|1)",
-                content,
-                re.IGNORECASE,
-            )
+            confidence_match = CONFIDENCE_PATTERN.search(content)
             confidence = float(confidence_match.group(1)) if confidence_match else 0.8
 
             # Create result dictionary
@@ -295,27 +410,138 @@ def find_element_coordinates_by_description(
                 "element_description": element_description,
             }
 
-        # Validate the response format
-        required_keys = ["x", "y", "confidence"]
-        for key in required_keys:
-            if key not in result:
-                raise ValueError(f"Invalid response format: missing '{key}' field")
+        result = _normalize_element(result, element_description)
+        _cache_put(cache_key, dict(result))
+        return result
 
-        # Add element_description if missing
-        if "element_description" not in result:
-            result["element_description"] = element_description
+    except Exception as e:
+        logger.error(f"Error finding element: {e}")
+        raise ValueError(f"Failed to find element: {str(e)}")
 
-        # Ensure coordinates are integers
-        result["x"] = int(result["x"])
-        result["y"] = int(result["y"])
 
-        # Ensure confidence is a float between 0 and 1
-        result["confidence"] = float(result["confidence"])
-        if not 0 <= result["confidence"] <= 1:
-            result["confidence"] = max(0, min(result["confidence"], 1))
+def find_multiple_element_coordinates(
+    screenshot: bytes | str, element_descriptions: list[str]
+) -> list[Dict[str, Any]]:
+    """Find several elements on the screen with a single vision request.
 
-        return result
+    The screenshot is uploaded once for all descriptions instead of once per
+    element. Results are cached the same way as find_element_coordinates_by_description,
+    so a later single lookup of any of the elements on the same screenshot is free.
+
+    Args:
+        screenshot: Screenshot image (PNG format), as raw bytes or base64-encoded.
+        element_descriptions: Textual descriptions of the elements to find.
+
+    Returns:
+        One dictionary per description, in the same order. Found elements have the
+        format {"x": int, "y": int, "confidence": float, "element_description": str};
+        elements that could not be found are {"element_description": str, "error": str}.
+
+    Raises:
+        ValueError: If the descriptions are empty or the response cannot be parsed.
+    """
+    if not element_descriptions:
+        raise ValueError("Element descriptions cannot be empty")
+
+    cache_keys = [
+        _cache_key("find", screenshot, description)
+        for description in element_descriptions
+    ]
+    results: list[Dict[str, Any] | None] = []
+    for key in cache_keys:
+        cached = _cache_get(key)
+        results.append(dict(cached) if cached is not None else None)
+    pending = [i for i, result in enumerate(results) if result is None]
+    if not pending:
+        logger.info("Returning cached element coordinates")
+        return results
+
+    numbered = "\n".join(
+        f"{n}. {element_descriptions[i]}" for n, i in enumerate(pending, start=1)
+    )
+    messages: list[dict[str, Any]] = [
+        {
+            "role": "system",
+            "content": "You are an expert at analyzing mobile app screens. The dimensions of the screen are 720 pixels wide by 1616 pixels high. The origin (0,0) is at the top left corner. Coordinates are specified in pixels, with x-coordinate first, then y-coordinate. Your task is to find specific UI elements based on textual descriptions and provide their exact center coordinates.",
+        },
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": f'Find the elements on the screen that match these descriptions:\n{numbered}\nRespond with only a JSON array containing one object per description, in the same order. Each object must have "x" and "y" (the coordinates of the center of the element), "confidence" (0.0-1.0) and "element_description" (a brief description of what you found). If you cannot find a matching element, use {{"error": "Element not found"}} for it instead. If a description is ambiguous and matches multiple elements, use {{"error": "Ambiguous description"}}.',
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {"url": _image_data_url(screenshot)},
+                },
+            ],
+        },
+    ]
+
+    try:
+        client, model = _get_client()
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            timeout=REQUEST_TIMEOUT,
+            max_tokens=LOOKUP_MAX_TOKENS * len(pending),
+            temperature=0,
+        )
+        logger.debug("Response received")
+
+        content = response.choices[0].message.content
+        logger.opt(lazy=True).debug("Raw response: {}", lambda: content)
+
+        # Models sometimes wrap the array in prose or a code fence
+        found = json.loads(content[content.find("[") : content.rfind("]") + 1])
+        if not isinstance(found, list) or len(found) != len(pending):
+            raise ValueError(
+                f"Invalid response format: expected a list of {len(pending)} results"
+            )
+
+        for i, result in zip(pending, found):
+            description = element_descriptions[i]
+            if "error" in result:
+                results[i] = {
+                    "element_description": description,
+                    "error": result["error"],
+                }
+                continue
+            results[i] = _normalize_element(result, description)
+            _cache_put(cache_keys[i], dict(results[i]))
+        return results
 
     except Exception as e:
-        logger.error(f"Error finding element: {e}")
-        raise ValueError(f"Failed to find element: {str(e)}")
+        logger.error(f"Error finding elements: {e}")
+        raise ValueError(f"Failed to find elements: {str(e)}")
+
+
+def _normalize_element(
+    result: Dict[str, Any], element_description: str
+) -> Dict[str, Any]:
+    """Validate an element lookup result and coerce its fields to the expected types.
+
+    Raises:
+        ValueError: If the x, y or confidence field is missing.
+    """
+    # Validate the response format
+    required_keys = ["x", "y", "confidence"]
+    for key in required_keys:
+        if key not in result:
+            raise ValueError(f"Invalid response format: missing '{key}' field")
+
+    # Add element_description if missing
+    if "element_description" not in result:
+        result["element_description"] = element_description
+
+    # Ensure coordinates are integers
+    result["x"] = int(result["x"])
+    result["y"] = int(result["y"])
+
+    # Ensure confidence is a float between 0 and 1
+    result["confidence"] = float(result["confidence"])
+    if not 0 <= result["confidence"] <= 1:
+        result["confidence"] = max(0, min(result["confidence"], 1))
+
+    return result